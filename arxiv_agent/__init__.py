@@ -8,6 +8,11 @@ high-level helpers from the package root::
 Use ``asyncio.run`` to call the async helpers from synchronous code.
 """
 
+import asyncio
+import atexit
+import threading
+import weakref
+
 from .models import IngestResult, PaperMetadata
 from .downloader import DownloadError, download_pdf
 from .ingest import ingest_query, search_arxiv, extract_text
@@ -24,27 +29,65 @@ __all__ = [
 
 __version__ = "0.1.0"
 
+# One asyncio.Runner per thread: a loop can only run in one thread at a time, so
+# sync wrappers called from a thread pool each get their own.
+_LOCAL = threading.local()
+_RUNNERS = set()
+_RUNNERS_LOCK = threading.Lock()
+
+
+def _close_runner(runner):
+	with _RUNNERS_LOCK:
+		if runner not in _RUNNERS:
+			return
+		_RUNNERS.discard(runner)
+	try:
+		runner.close()
+	except Exception:
+		pass
+
+
+def _close_runners():
+	for runner in list(_RUNNERS):
+		_close_runner(runner)
+
+
+atexit.register(_close_runners)
+
+
+def _run(coro):
+	"""Run `coro` on the calling thread's event loop, reused by every sync wrapper.
+
+	Reusing the loop avoids creating and tearing one down per call, and keeps
+	loop-bound resources (cached DB connections, executors) usable across calls.
+	Each thread has its own loop; it is closed when the thread goes away or at exit.
+	"""
+	if not hasattr(asyncio, "Runner"):
+		return asyncio.run(coro)
+	runner = getattr(_LOCAL, "runner", None)
+	if runner is None:
+		runner = _LOCAL.runner = asyncio.Runner()
+		with _RUNNERS_LOCK:
+			_RUNNERS.add(runner)
+		weakref.finalize(threading.current_thread(), _close_runner, runner)
+	return runner.run(coro)
+
 
 def ingest_query_sync(*args, **kwargs):
 	"""Synchronous wrapper for `ingest_query`.
 
 	Example: ingest_query_sync(query, max_results=2, output_dir="downloads", db_path="data.db")
 	"""
-	import asyncio
-
-	return asyncio.run(ingest_query(*args, **kwargs))
+	return _run(ingest_query(*args, **kwargs))
 
 
 def download_pdf_sync(*args, **kwargs):
 	"""Synchronous wrapper for `download_pdf`."""
-	import asyncio
-
-	return asyncio.run(download_pdf(*args, **kwargs))
+	return _run(download_pdf(*args, **kwargs))
 
 
 def get_embedding_sync(text: str, backend: str = "openai", **kwargs):
-	import asyncio
 	from .nlp import get_embedding
 
-	return asyncio.run(asyncio.to_thread(get_embedding, text, backend, **kwargs))
+	return _run(asyncio.to_thread(get_embedding, text, backend, **kwargs))
 
@@ -36,13 +36,13 @@ async def _download_mode(arxiv_id: str, output: str, dry_run: bool) -> int:
         return 1
 
 
-async def _ingest_mode(query: str, max_results: int, output: str, dry_run: bool, db_path: str | None = None) -> int:
+async def _ingest_mode(query: str, max_results: int, output: str, dry_run: bool, db_path: str | None = None, force: bool = False) -> int:
     if dry_run:
         console.print(f"[yellow]Dry run:[/yellow] would ingest query='{query}' max_results={max_results} -> {output}")
         return 0
 
     try:
-        results = await ingest_query(query, max_results=max_results, output_dir=output, db_path=db_path)
+        results = await ingest_query(query, max_results=max_results, output_dir=output, db_path=db_path, force=force)
         console.print(f"[green]Ingested {len(results)} papers into[/green] {output}")
         for r in results:
             meta = r.get("meta")
@@ -61,9 +61,27 @@ async def _embed_mode(
     limit: int | None,
     batch_size: int | None = None,
     delay: float | None = None,
+    rpm: int | None = None,
+    tpm: int | None = None,
+    concurrency: int = 1,
+    fp16: bool = False,
 ) -> int:
     try:
-        results = embed_missing(db_path, backend=backend, model=model, chroma_dir=chroma_dir, limit=limit, batch_size=batch_size, delay=delay)
+        # embed_missing drives its own event loop, which cannot run inside this one
+        results = await asyncio.to_thread(
+            embed_missing,
+            db_path,
+            backend=backend,
+            model=model,
+            chroma_dir=chroma_dir,
+            limit=limit,
+            batch_size=batch_size,
+            delay=delay,
+            rpm=rpm,
+            tpm=tpm,
+            concurrency=concurrency,
+            fp16=fp16,
+        )
         console.print(f"[green]Embedded {len(results)} papers.[/green]")
         return 0
     except Exception as exc:
@@ -73,7 +91,7 @@ async def _embed_mode(
 
 async def run(args: argparse.Namespace) -> int:
     if args.ingest:
-        return await _ingest_mode(args.ingest, args.max_results, args.output, args.dry_run, db_path=args.db)
+        return await _ingest_mode(args.ingest, args.max_results, args.output, args.dry_run, db_path=args.db, force=args.force)
     if args.embed:
         return await _embed_mode(
             args.db,
@@ -83,6 +101,10 @@ async def run(args: argparse.Namespace) -> int:
             args.embed_limit,
             args.embed_batch_size,
             args.embed_batch_delay,
+            args.embed_rpm,
+            args.embed_tpm,
+            args.embed_concurrency,
+            args.embed_fp16,
         )
     return await _download_mode(args.id, args.output, args.dry_run)
 
@@ -92,6 +114,7 @@ def main() -> None:
     parser.add_argument("--dry-run", action="store_true", help="Show actions without downloading")
     parser.add_argument("--id", help="arXiv id (e.g., 2101.00001)")
     parser.add_argument("--ingest", help="Run ingestion for a query string (mutually exclusive with --id)")
+    parser.add_argument("--force", action="store_true", help="Re-download and re-extract papers already present in the output directory")
     parser.add_argument("--db", default=None, help="Path to sqlite DB file to persist metadata and embeddings")
     parser.add_argument("--embed", action="store_true", help="Compute embeddings for papers missing them in the DB")
     parser.add_argument("--embed-backend", default="openai", help="Embedding backend: openai or local")
@@ -99,6 +122,10 @@ def main() -> None:
     parser.add_argument("--embed-limit", type=int, default=None, help="Limit number of papers to embed in one run")
     parser.add_argument("--embed-batch-size", type=int, default=None, help="Batch size for embeddings to help with rate limits")
     parser.add_argument("--embed-batch-delay", type=float, default=None, help="Delay in seconds between embedding batches")
+    parser.add_argument("--embed-rpm", type=int, default=None, help="Max embedding requests per minute (waits proactively instead of hitting 429s)")
+    parser.add_argument("--embed-tpm", type=int, default=None, help="Max embedding tokens per minute")
+    parser.add_argument("--embed-concurrency", type=int, default=1, help="Number of embedding batches requested concurrently")
+    parser.add_argument("--embed-fp16", action="store_true", help="Store embedding vectors as float16 (half the size, ~3 significant digits)")
     parser.add_argument("--chroma-dir", default=None, help="Directory to persist Chroma DB (optional)")
     parser.add_argument("--max-results", type=int, default=5, help="Max results for ingestion")
     parser.add_argument("--output", default="downloads", help="Output directory")
@@ -1,15 +1,45 @@
 """Simple async SQLite DB helpers for arxiv-agent.
 
 This module provides tiny convenience functions around `aiosqlite` to store
-paper metadata, processing status, and simple query helpers.
+paper metadata, processing status, and simple query helpers. Connections are
+opened once per database file and cached (see `get_conn`); every helper accepts
+either a path or an already open `aiosqlite.Connection`.
 """
 from __future__ import annotations
 
+import asyncio
+import atexit
 import json
+import logging
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union, AsyncIterator, Iterable, List, Tuple
 
 import aiosqlite
+import numpy as np
+
+try:  # optional: several times faster than the stdlib for the JSON columns below
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+DBLike = Union[str, Path, aiosqlite.Connection]
+
+# Applied once when a connection is first opened (see `get_conn`).
+PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-64000;
+PRAGMA mmap_size=268435456;
+PRAGMA busy_timeout=5000;
+"""
 
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS papers (
@@ -40,136 +70,457 @@ CREATE TABLE IF NOT EXISTS embeddings (
     id INTEGER PRIMARY KEY,
     paper_id INTEGER,
     model TEXT,
-    vector_json TEXT,
+    vector BLOB,
+    dim INTEGER,
+    dtype TEXT,
     chroma_id TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY(paper_id) REFERENCES papers(id)
 );
+
+-- papers(arxiv_id) is already indexed by its UNIQUE constraint
+CREATE INDEX IF NOT EXISTS idx_processing_stage_status ON processing(stage, status);
+CREATE INDEX IF NOT EXISTS idx_embeddings_paper ON embeddings(paper_id);
 """
 
+INSERT_PROCESSING = "INSERT INTO processing (paper_id, stage, status, error) VALUES (?, ?, ?, ?)"
+INSERT_EMBEDDING = "INSERT INTO embeddings (paper_id, model, vector, dim, dtype) VALUES (?, ?, ?, ?, ?)"
 
-async def init_db(db_path: str | Path) -> None:
+_CONNECTIONS: Dict[str, aiosqlite.Connection] = {}
+_LOCKS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Any, asyncio.Lock]]" = weakref.WeakKeyDictionary()
+# Cross-thread side of `_lock`: one per connection, plus one for opening connections.
+_THREAD_LOCKS: "weakref.WeakKeyDictionary[aiosqlite.Connection, threading.Lock]" = weakref.WeakKeyDictionary()
+_THREAD_LOCKS_GUARD = threading.Lock()
+_OPEN_LOCK = threading.Lock()
+# Connections whose schema is already set up; a new connection (or a reopened file)
+# starts outside the set and runs the DDL once.
+_INITIALIZED: "weakref.WeakSet[aiosqlite.Connection]" = weakref.WeakSet()
+
+
+def _conn_key(db_path: str | Path) -> str:
     db_path = str(db_path)
-    async with aiosqlite.connect(db_path) as db:
+    if db_path == ":memory:":
+        return db_path
+    return str(Path(db_path).resolve())
+
+
+def _loop_lock(key: Any) -> asyncio.Lock:
+    # asyncio locks are bound to the loop that first waits on them, so keep them per loop
+    locks = _LOCKS.setdefault(asyncio.get_running_loop(), {})
+    lock = locks.get(key)
+    if lock is None:
+        lock = locks[key] = asyncio.Lock()
+    return lock
+
+
+def _thread_lock(key: Any) -> threading.Lock:
+    if key is None:
+        return _OPEN_LOCK
+    with _THREAD_LOCKS_GUARD:
+        lock = _THREAD_LOCKS.get(key)
+        if lock is None:
+            lock = _THREAD_LOCKS[key] = threading.Lock()
+        return lock
+
+
+@asynccontextmanager
+async def _lock(key: Any = None) -> AsyncIterator[None]:
+    """Hold the lock of connection `key` (None: the one for opening connections).
+
+    Cached connections are shared by every thread and event loop (the sync wrappers
+    run one loop per thread), so the lock is a `threading.Lock`. Tasks of one loop
+    queue on an asyncio lock first, and the thread lock is waited for in a worker
+    thread, so a loop never blocks on it.
+    """
+    async with _loop_lock(key):
+        lock = _thread_lock(key)
+        if not lock.acquire(blocking=False):
+            waiter = asyncio.ensure_future(asyncio.to_thread(lock.acquire))
+            try:
+                await asyncio.shield(waiter)
+            except asyncio.CancelledError:
+                # the worker still gets the lock; give it back as soon as it does
+                waiter.add_done_callback(lambda _: lock.release())
+                raise
+        try:
+            yield
+        finally:
+            lock.release()
+
+
+async def get_conn(db_path: DBLike) -> aiosqlite.Connection:
+    """Return a cached connection for `db_path`, opening it on first use.
+
+    Passing an existing `aiosqlite.Connection` returns it unchanged so every helper
+    below accepts either a path or a connection.
+    """
+    if isinstance(db_path, aiosqlite.Connection):
+        return db_path
+    key = _conn_key(db_path)
+    db = _CONNECTIONS.get(key)
+    if db is not None:
+        return db
+    async with _lock():
+        db = _CONNECTIONS.get(key)
+        if db is None:
+            conn = aiosqlite.connect(key)
+            # The worker thread must not keep the interpreter alive, otherwise the
+            # atexit hook that closes cached connections would never run.
+            getattr(conn, "_thread", conn).daemon = True
+            db = await conn
+            await db.executescript(PRAGMAS)
+            _CONNECTIONS[key] = db
+        return db
+
+
+async def close_db(db_path: str | Path) -> None:
+    """Close and forget the cached connection for `db_path`, if any."""
+    db = _CONNECTIONS.pop(_conn_key(db_path), None)
+    if db is not None:
+        await db.close()
+
+
+async def close_all() -> None:
+    """Close every cached connection."""
+    while _CONNECTIONS:
+        _, db = _CONNECTIONS.popitem()
+        await db.close()
+
+
+def _close_all_at_exit() -> None:
+    if not _CONNECTIONS:
+        return
+    try:
+        asyncio.run(close_all())
+    except Exception:
+        pass
+
+
+atexit.register(_close_all_at_exit)
+
+
+@asynccontextmanager
+async def transaction(db_path: DBLike) -> AsyncIterator[aiosqlite.Connection]:
+    """Run the enclosed statements in a single ``BEGIN IMMEDIATE ... COMMIT``.
+
+    Writers sharing the cached connection are serialized so their statements never
+    interleave inside each other's transaction.
+    """
+    db = await get_conn(db_path)
+    async with _lock(db):
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            await db.rollback()
+            raise
+        await db.commit()
+
+
+def _dumps(obj: Any) -> str:
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode() if orjson is not None else json.dumps(obj)
+
+
+def _loads(text: str | bytes) -> Any:
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def _encode_vector(vector: Any, fp16: bool = False) -> Tuple[bytes, int, str]:
+    arr = np.asarray(vector, dtype=np.float16 if fp16 else np.float32)
+    return arr.tobytes(), int(arr.size), arr.dtype.name
+
+
+async def _migrate_vector_json(db: aiosqlite.Connection) -> None:
+    """Convert embeddings stored by older versions as JSON text into float32 BLOBs."""
+    async with db.execute("PRAGMA table_info(embeddings)") as cur:
+        columns = {row[1] for row in await cur.fetchall()}
+    if "vector_json" not in columns:
+        return
+    for name, decl in (("vector", "BLOB"), ("dim", "INTEGER"), ("dtype", "TEXT")):
+        if name not in columns:
+            await db.execute(f"ALTER TABLE embeddings ADD COLUMN {name} {decl}")
+    async with db.execute("SELECT id, vector_json FROM embeddings WHERE vector IS NULL AND vector_json IS NOT NULL") as cur:
+        rows = await cur.fetchall()
+    await db.executemany(
+        "UPDATE embeddings SET vector = ?, dim = ?, dtype = ?, vector_json = NULL WHERE id = ?",
+        [(*_encode_vector(_loads(vec_json)), emb_id) for emb_id, vec_json in rows],
+    )
+
+
+async def init_db(db_path: DBLike, fast_unsafe: Optional[bool] = None) -> None:
+    """Create the schema (idempotent) and migrate rows written by older versions.
+
+    The whole schema is applied with one ``executescript`` round-trip, and only once
+    per connection: later calls on the same (cached) connection return immediately.
+
+    `fast_unsafe=True` switches the connection to ``synchronous=OFF``: commits skip
+    fsync entirely, so a power loss can corrupt the file. Meant for tests and demos.
+    `fast_unsafe=False` switches it back to ``synchronous=NORMAL`` (the mode every
+    connection is opened with); left at None, the current mode is kept.
+    """
+    db = await get_conn(db_path)
+    async with _lock(db):
+        # holding the lock: PRAGMA synchronous fails inside another caller's transaction
+        if fast_unsafe is not None:
+            await db.execute(f"PRAGMA synchronous={'OFF' if fast_unsafe else 'NORMAL'}")
+        if db in _INITIALIZED:
+            return
         await db.executescript(SCHEMA)
+        await _migrate_vector_json(db)
         await db.commit()
+        # refresh planner statistics when they are stale (cheaper than a full ANALYZE)
+        await db.execute("PRAGMA optimize")
+        _INITIALIZED.add(db)
 
 
-async def upsert_paper(db_path: str | Path, metadata: Any, pdf_path: Optional[str] = None, text_path: Optional[str] = None) -> int:
-    """Insert or update a paper by `arxiv_id`. Returns the paper id."""
-    db_path = str(db_path)
-    authors_json = json.dumps(metadata.authors if getattr(metadata, "authors", None) is not None else [])
-    raw_json = json.dumps(getattr(metadata, "raw", None))
+UPSERT_PAPER = """
+INSERT INTO papers (arxiv_id, title, authors, summary, published, pdf_path, text_path, raw_json)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(arxiv_id) DO UPDATE SET
+    title = excluded.title,
+    authors = excluded.authors,
+    summary = excluded.summary,
+    published = excluded.published,
+    pdf_path = COALESCE(excluded.pdf_path, papers.pdf_path),
+    text_path = COALESCE(excluded.text_path, papers.text_path),
+    raw_json = excluded.raw_json,
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+
+def _paper_params(metadata: Any, pdf_path: Optional[str] = None, text_path: Optional[str] = None) -> Tuple[Any, ...]:
+    authors_json = _dumps(metadata.authors if getattr(metadata, "authors", None) is not None else [])
+    raw_json = _dumps(getattr(metadata, "raw", None))
     published = getattr(metadata, "published", None)
     published_val = published.isoformat() if published is not None else None
+    return (
+        metadata.arxiv_id,
+        getattr(metadata, "title", None),
+        authors_json,
+        getattr(metadata, "summary", None),
+        published_val,
+        pdf_path,
+        text_path,
+        raw_json,
+    )
 
-    async with aiosqlite.connect(db_path) as db:
-        await db.execute(
-            "INSERT OR IGNORE INTO papers (arxiv_id, title, authors, summary, published, pdf_path, text_path, raw_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            (
-                metadata.arxiv_id,
-                getattr(metadata, "title", None),
-                authors_json,
-                getattr(metadata, "summary", None),
-                published_val,
-                pdf_path,
-                text_path,
-                raw_json,
-            ),
-        )
-        # update fields if provided or to refresh raw/title
-        await db.execute(
-            "UPDATE papers SET title = ?, authors = ?, summary = ?, published = ?, pdf_path = COALESCE(?, pdf_path), text_path = COALESCE(?, text_path), raw_json = ?, updated_at = CURRENT_TIMESTAMP WHERE arxiv_id = ?",
-            (
-                getattr(metadata, "title", None),
-                authors_json,
-                getattr(metadata, "summary", None),
-                published_val,
-                pdf_path,
-                text_path,
-                raw_json,
-                metadata.arxiv_id,
-            ),
-        )
-        await db.commit()
-        cur = await db.execute("SELECT id FROM papers WHERE arxiv_id = ?", (metadata.arxiv_id,))
+
+async def _upsert_paper(db: aiosqlite.Connection, metadata: Any, pdf_path: Optional[str] = None, text_path: Optional[str] = None) -> int:
+    # single statement insert-or-update (requires SQLite >= 3.35 for RETURNING)
+    async with db.execute(UPSERT_PAPER + "RETURNING id", _paper_params(metadata, pdf_path, text_path)) as cur:
         row = await cur.fetchone()
-        return int(row[0])
+    return int(row[0])
 
 
-async def get_paper_by_arxiv_id(db_path: str | Path, arxiv_id: str) -> Optional[Dict[str, Any]]:
-    db_path = str(db_path)
-    async with aiosqlite.connect(db_path) as db:
-        cur = await db.execute("SELECT id, arxiv_id, title, authors, summary, published, pdf_path, text_path, raw_json, created_at, updated_at FROM papers WHERE arxiv_id = ?", (arxiv_id,))
+async def upsert_paper(db_path: DBLike, metadata: Any, pdf_path: Optional[str] = None, text_path: Optional[str] = None) -> int:
+    """Insert or update a paper by `arxiv_id`. Returns the paper id."""
+    async with transaction(db_path) as db:
+        return await _upsert_paper(db, metadata, pdf_path=pdf_path, text_path=text_path)
+
+
+async def upsert_paper_and_mark(
+    db_path: DBLike,
+    metadata: Any,
+    stage: str,
+    status: str,
+    pdf_path: Optional[str] = None,
+    text_path: Optional[str] = None,
+    error: Optional[str] = None,
+) -> int:
+    """Upsert a paper and record a processing status in one transaction. Returns the paper id."""
+    async with transaction(db_path) as db:
+        paper_id = await _upsert_paper(db, metadata, pdf_path=pdf_path, text_path=text_path)
+        await db.execute(INSERT_PROCESSING, (paper_id, stage, status, error))
+    return paper_id
+
+
+# stay well under SQLITE_MAX_VARIABLE_NUMBER when looking ids up with IN (...)
+_ID_CHUNK = 500
+
+
+async def get_papers_by_arxiv_ids(db_path: DBLike, arxiv_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Look many papers up with one `IN (...)` query per 500 ids.
+
+    Returns `{arxiv_id: {"id", "arxiv_id", "pdf_path", "text_path"}}` for the ids that exist.
+    """
+    db = await get_conn(db_path)
+    papers: Dict[str, Dict[str, Any]] = {}
+    for i in range(0, len(arxiv_ids), _ID_CHUNK):
+        chunk = arxiv_ids[i : i + _ID_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        async with db.execute(f"SELECT id, arxiv_id, pdf_path, text_path FROM papers WHERE arxiv_id IN ({placeholders})", chunk) as cur:
+            for r in await cur.fetchall():
+                papers[r[1]] = {"id": r[0], "arxiv_id": r[1], "pdf_path": r[2], "text_path": r[3]}
+    return papers
+
+
+async def upsert_papers_bulk(
+    db_path: DBLike,
+    papers: Iterable[Tuple[Any, Optional[str], Optional[str]]],
+    stage: Optional[str] = None,
+    status: Optional[str] = None,
+) -> list[int]:
+    """Upsert many `(metadata, pdf_path, text_path)` tuples in one transaction.
+
+    When `stage` and `status` are given a processing row is recorded for every paper
+    in the same transaction. Returns the paper ids in input order.
+    """
+    params = [_paper_params(meta, pdf_path=pdf, text_path=txt) for meta, pdf, txt in papers]
+    if not params:
+        return []
+    arxiv_ids = [p[0] for p in params]
+    async with transaction(db_path) as db:
+        await db.executemany(UPSERT_PAPER, params)
+        rows = await get_papers_by_arxiv_ids(db, list(dict.fromkeys(arxiv_ids)))
+        paper_ids = [rows[a]["id"] for a in arxiv_ids]
+        if stage is not None and status is not None:
+            await db.executemany(INSERT_PROCESSING, [(pid, stage, status, None) for pid in paper_ids])
+    return paper_ids
+
+
+async def get_paper_by_arxiv_id(db_path: DBLike, arxiv_id: str) -> Optional[Dict[str, Any]]:
+    db = await get_conn(db_path)
+    async with db.execute("SELECT id, arxiv_id, title, authors, summary, published, pdf_path, text_path, raw_json, created_at, updated_at FROM papers WHERE arxiv_id = ?", (arxiv_id,)) as cur:
         row = await cur.fetchone()
-        if not row:
-            return None
-        authors = json.loads(row[3]) if row[3] else []
-        raw = json.loads(row[8]) if row[8] else None
-        return {
-            "id": row[0],
-            "arxiv_id": row[1],
-            "title": row[2],
-            "authors": authors,
-            "summary": row[4],
-            "published": row[5],
-            "pdf_path": row[6],
-            "text_path": row[7],
-            "raw": raw,
-            "created_at": row[9],
-            "updated_at": row[10],
-        }
-
-
-async def set_processing(db_path: str | Path, paper_id: int, stage: str, status: str, error: Optional[str] = None) -> None:
-    db_path = str(db_path)
-    async with aiosqlite.connect(db_path) as db:
-        await db.execute(
-            "INSERT INTO processing (paper_id, stage, status, error) VALUES (?, ?, ?, ?)",
-            (paper_id, stage, status, error),
-        )
-        await db.commit()
+    if not row:
+        return None
+    authors = _loads(row[3]) if row[3] else []
+    raw = _loads(row[8]) if row[8] else None
+    return {
+        "id": row[0],
+        "arxiv_id": row[1],
+        "title": row[2],
+        "authors": authors,
+        "summary": row[4],
+        "published": row[5],
+        "pdf_path": row[6],
+        "text_path": row[7],
+        "raw": raw,
+        "created_at": row[9],
+        "updated_at": row[10],
+    }
 
 
-async def list_pending(db_path: str | Path, stage: str = "extract") -> list[Dict[str, Any]]:
-    db_path = str(db_path)
-    async with aiosqlite.connect(db_path) as db:
-        cur = await db.execute(
-            "SELECT p.id, p.arxiv_id, p.title, p.pdf_path, p.text_path FROM papers p JOIN processing pr ON pr.paper_id = p.id WHERE pr.stage = ? AND pr.status = 'pending'",
-            (stage,),
-        )
+async def set_processing(db_path: DBLike, paper_id: int, stage: str, status: str, error: Optional[str] = None) -> None:
+    async with transaction(db_path) as db:
+        await db.execute(INSERT_PROCESSING, (paper_id, stage, status, error))
+
+
+async def list_pending(db_path: DBLike, stage: str = "extract") -> list[Dict[str, Any]]:
+    db = await get_conn(db_path)
+    async with db.execute(
+        "SELECT p.id, p.arxiv_id, p.title, p.pdf_path, p.text_path FROM papers p JOIN processing pr ON pr.paper_id = p.id WHERE pr.stage = ? AND pr.status = 'pending'",
+        (stage,),
+    ) as cur:
         rows = await cur.fetchall()
-        return [
-            {"id": r[0], "arxiv_id": r[1], "title": r[2], "pdf_path": r[3], "text_path": r[4]} for r in rows
-        ]
+    return [
+        {"id": r[0], "arxiv_id": r[1], "title": r[2], "pdf_path": r[3], "text_path": r[4]} for r in rows
+    ]
 
 
-async def save_embedding(db_path: str | Path, paper_id: int, model: str, vector: list[float]) -> int:
-    db_path = str(db_path)
-    vec_json = json.dumps(vector)
-    async with aiosqlite.connect(db_path) as db:
-        cur = await db.execute(
-            "INSERT INTO embeddings (paper_id, model, vector_json) VALUES (?, ?, ?)", (paper_id, model, vec_json)
+async def save_embedding(db_path: DBLike, paper_id: int, model: str, vector: list[float], fp16: bool = False) -> int:
+    """Store `vector` as a packed float32 (or float16 with `fp16=True`) BLOB. Returns the embedding id."""
+    async with transaction(db_path) as db:
+        cur = await db.execute(INSERT_EMBEDDING, (paper_id, model, *_encode_vector(vector, fp16)))
+    return int(cur.lastrowid)
+
+
+async def save_embeddings(db_path: DBLike, rows: List[Tuple[int, str, list[float]]], fp16: bool = False) -> list[int]:
+    """Insert `(paper_id, model, vector)` rows with one `executemany`. Returns the new ids in order.
+
+    `fp16=True` halves the storage per vector at the cost of ~3 significant digits.
+    """
+    if not rows:
+        return []
+    async with transaction(db_path) as db:
+        await db.executemany(
+            INSERT_EMBEDDING,
+            [(paper_id, model, *_encode_vector(vector, fp16)) for paper_id, model, vector in rows],
         )
-        await db.commit()
-        return int(cur.lastrowid)
+        async with db.execute("SELECT last_insert_rowid()") as cur:
+            (last_id,) = await cur.fetchone()
+    # rowids are allocated sequentially while the write transaction holds the lock
+    return list(range(last_id - len(rows) + 1, last_id + 1))
 
 
-async def get_embeddings_for_paper(db_path: str | Path, paper_id: int) -> list[Dict[str, Any]]:
-    db_path = str(db_path)
-    async with aiosqlite.connect(db_path) as db:
-        cur = await db.execute("SELECT id, model, vector_json, created_at FROM embeddings WHERE paper_id = ?", (paper_id,))
+async def get_embeddings_for_paper(db_path: DBLike, paper_id: int) -> list[Dict[str, Any]]:
+    db = await get_conn(db_path)
+    async with db.execute("SELECT id, model, vector, dtype, created_at FROM embeddings WHERE paper_id = ?", (paper_id,)) as cur:
         rows = await cur.fetchall()
-        return [
-            {"id": r[0], "model": r[1], "vector": json.loads(r[2]), "created_at": r[3]} for r in rows
-        ]
+    return [
+        {"id": r[0], "model": r[1], "vector": np.frombuffer(r[2], dtype=r[3] or "float32"), "created_at": r[4]} for r in rows
+    ]
 
 
-async def papers_without_embeddings(db_path: str | Path) -> list[Dict[str, Any]]:
-    db_path = str(db_path)
-    async with aiosqlite.connect(db_path) as db:
-        cur = await db.execute(
-            "SELECT p.id, p.arxiv_id, p.title, p.text_path FROM papers p LEFT JOIN embeddings e ON e.paper_id = p.id WHERE e.id IS NULL"
-        )
+async def papers_without_embeddings(db_path: DBLike) -> list[Dict[str, Any]]:
+    db = await get_conn(db_path)
+    async with db.execute(
+        "SELECT p.id, p.arxiv_id, p.title, p.text_path FROM papers p WHERE NOT EXISTS (SELECT 1 FROM embeddings e WHERE e.paper_id = p.id)"
+    ) as cur:
         rows = await cur.fetchall()
-        return [{"id": r[0], "arxiv_id": r[1], "title": r[2], "text_path": r[3]} for r in rows]
+    return [{"id": r[0], "arxiv_id": r[1], "title": r[2], "text_path": r[3]} for r in rows]
+
+
+class WriteBatcher:
+    """Coalesce fire-and-forget writes into batched transactions.
+
+    Statements queued with `submit` are flushed by a background task, grouped with
+    `executemany`, whenever `max_rows` are pending or `max_delay` seconds have passed
+    since the first queued row::
+
+        async with WriteBatcher(db_path) as batcher:
+            batcher.submit(INSERT_PROCESSING, (paper_id, "extract", "success", None))
+
+    A batch whose transaction fails is logged and dropped; later batches still run.
+    """
+
+    def __init__(self, db_path: DBLike, max_rows: int = 25, max_delay: float = 0.1) -> None:
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._pending: List[Tuple[str, Tuple[Any, ...]]] = []
+        self._has_rows = asyncio.Event()
+        self._full = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "WriteBatcher":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self._closing = True
+        self._has_rows.set()
+        self._full.set()
+        await self._task
+
+    def submit(self, sql: str, params: Tuple[Any, ...]) -> None:
+        self._pending.append((sql, params))
+        self._has_rows.set()
+        if len(self._pending) >= self.max_rows:
+            self._full.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_rows.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            rows, self._pending = self._pending, []
+            self._has_rows.clear()
+            self._full.clear()
+            if rows:
+                try:
+                    await self._flush(rows)
+                except Exception:
+                    # one failed batch must not stop later writes or the caller's run
+                    logger.exception("dropped %d batched writes after a failed flush", len(rows))
+            if self._closing and not self._pending:
+                return
+
+    async def _flush(self, rows: List[Tuple[str, Tuple[Any, ...]]]) -> None:
+        async with transaction(self.db_path) as db:
+            # keep submission order; consecutive rows sharing a statement go in one executemany
+            for sql, group in groupby(rows, key=itemgetter(0)):
+                await db.executemany(sql, [params for _, params in group])
@@ -4,49 +4,302 @@ This module provides a small, reusable async PDF downloader with retry/backoff.
 """
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import os
+import queue
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 import httpx
-import aiofiles
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from tenacity import RetryCallState, retry, retry_if_exception, stop_after_attempt, wait_exponential, wait_random
+
+try:  # optional: BLAKE3 is several times faster than hashlib's BLAKE2 when installed
+    import blake3
+except ImportError:
+    blake3 = None
+
+from .http import borrow_client
+
+
+CHUNK_SIZE = 64 * 1024
+PDF_MAGIC = b"%PDF"
+# Chunks buffered between the network reader and the disk writer thread.
+WRITE_QUEUE_SIZE = 16
+# Queued chunks are flushed together once this many bytes are pending (or the queue is empty).
+WRITE_BATCH_BYTES = 1024 * 1024
+_HAVE_WRITEV = hasattr(os, "writev")
+_IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") and "SC_IOV_MAX" in os.sysconf_names else 16
+
+# Responses worth retrying; anything else (404, 403, ...) fails immediately.
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Upper bound for a server-provided Retry-After so one response cannot stall a run.
+MAX_RETRY_AFTER = 60.0
+
+
+# Digest algorithm for the `<pdf>.<HASH_NAME>` sidecar written next to each download.
+HASH_NAME = "blake3" if blake3 is not None else "blake2b"
 
 
 class DownloadError(Exception):
     pass
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10), retry=retry_if_exception_type(Exception))
-async def download_pdf(url: str, dest: Path, client: Optional[httpx.AsyncClient] = None) -> Path:
-    """Download a PDF from `url` into `dest` (Path).
+class _StalePartial(Exception):
+    """The server rejected resuming a leftover `.part` file; it was removed, retry from scratch."""
 
-    - Writes to a temporary `.part` file and atomically replaces the destination on success.
-    - Retries on exceptions using tenacity.
+
+def _new_hasher() -> Any:
+    return blake3.blake3() if blake3 is not None else hashlib.blake2b()
+
+
+def digest_path(dest: Path) -> Path:
+    """Sidecar file holding the hex digest of `dest`."""
+    return dest.with_name(f"{dest.name}.{HASH_NAME}")
+
+
+def file_digest(path: Path) -> str:
+    h = _new_hasher()
+    with open(path, "rb") as f:
+        while block := f.read(WRITE_BATCH_BYTES):
+            h.update(block)
+    return h.hexdigest()
+
+
+def is_intact(dest: Path) -> bool:
+    """True if `dest` exists and matches the digest recorded when it was downloaded.
+
+    Files without a sidecar (e.g. from older versions) are trusted as long as they exist.
     """
-    close_client = False
-    if client is None:
-        client = httpx.AsyncClient(timeout=60.0)
-        close_client = True
+    try:
+        expected = digest_path(dest).read_text(encoding="ascii").strip()
+    except FileNotFoundError:
+        return dest.exists()
+    except OSError:
+        return False
+    try:
+        return file_digest(dest) == expected
+    except OSError:
+        return False
 
+
+def _is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, _StalePartial):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRY_STATUS_CODES
+    # TransportError covers connection failures and timeouts
+    return isinstance(exc, httpx.TransportError)
+
+
+def _retry_after(exc: Optional[BaseException]) -> float:
+    """Seconds requested by a `Retry-After` header (delta-seconds or HTTP date), else 0."""
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return 0.0
+    value = exc.response.headers.get("Retry-After")
+    if not value:
+        return 0.0
     try:
-        resp = await client.get(url, follow_redirects=True)
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return 0.0
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+_backoff = wait_exponential(multiplier=1, min=1, max=10) + wait_random(0, 1)
+
+
+def _wait(retry_state: RetryCallState) -> float:
+    """Jittered exponential backoff, extended to honor the server's `Retry-After`."""
+    return max(_backoff(retry_state), _retry_after(retry_state.outcome.exception()))
+
+
+def _write_all(fd: int, buffers: List[bytes]) -> None:
+    """Write every buffer with as few syscalls as possible (`writev` where available)."""
+    views = [memoryview(b) for b in buffers if b]
+    while views:
+        if _HAVE_WRITEV:
+            written = os.writev(fd, views[:_IOV_MAX])
+        else:
+            written = os.write(fd, views[0])
+        # drop fully written buffers and trim a partially written one
+        while written and written >= len(views[0]):
+            written -= len(views.pop(0))
+        if written:
+            views[0] = views[0][written:]
+
+
+def _write_chunks(path: Path, chunks: "queue.Queue[Optional[bytes]]", append: bool = False) -> str:
+    """Write queued chunks to `path` until a None sentinel arrives (runs in a worker thread).
+
+    Chunks that are already queued are gathered (up to `WRITE_BATCH_BYTES`) and
+    written with one `writev` call. With `append=True` the chunks extend the existing
+    file. Returns the digest of the whole file. The queue is always drained to the
+    sentinel, even after a write error, so the producer never blocks on a full
+    queue; the error is raised at the end.
+    """
+    error: Optional[OSError] = None
+    hasher = _new_hasher()
+    fd = -1
+    try:
+        if append:
+            # resumed download: the digest covers the bytes fetched by earlier attempts too
+            with open(path, "rb") as f:
+                while block := f.read(WRITE_BATCH_BYTES):
+                    hasher.update(block)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | (os.O_APPEND if append else os.O_TRUNC), 0o644)
+    except OSError as exc:
+        error = exc
+    try:
+        done = False
+        while not done:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            batch, size = [chunk], len(chunk)
+            while size < WRITE_BATCH_BYTES:
+                try:
+                    chunk = chunks.get_nowait()
+                except queue.Empty:
+                    break
+                if chunk is None:
+                    done = True
+                    break
+                batch.append(chunk)
+                size += len(chunk)
+            if error is not None:
+                continue
+            try:
+                for chunk in batch:
+                    hasher.update(chunk)
+                _write_all(fd, batch)
+            except OSError as exc:
+                error = exc
+    finally:
+        if fd >= 0:
+            os.close(fd)
+    if error is not None:
+        raise error
+    return hasher.hexdigest()
+
+
+def _partial_size(tmp: Path) -> int:
+    """Bytes of a leftover `.part` file worth resuming (0 if missing or not a PDF)."""
+    try:
+        with tmp.open("rb") as f:
+            if f.read(len(PDF_MAGIC)) != PDF_MAGIC:
+                return 0
+            return os.fstat(f.fileno()).st_size
+    except OSError:
+        return 0
+
+
+def _validator_path(tmp: Path) -> Path:
+    """File holding the ETag / Last-Modified of the response a `.part` file came from."""
+    return tmp.with_name(f"{tmp.name}.validator")
+
+
+def _save_validator(tmp: Path, resp: httpx.Response) -> None:
+    # If-Range needs a strong ETag; Last-Modified is the fallback validator
+    etag = resp.headers.get("ETag")
+    validator = etag if etag and not etag.startswith("W/") else resp.headers.get("Last-Modified")
+    path = _validator_path(tmp)
+    if validator:
+        path.write_text(validator, encoding="utf-8")
+    else:
+        path.unlink(missing_ok=True)
+
+
+def _load_validator(tmp: Path) -> Optional[str]:
+    try:
+        return _validator_path(tmp).read_text(encoding="utf-8").strip() or None
+    except OSError:
+        return None
+
+
+async def _put(chunks: "queue.Queue[Optional[bytes]]", item: Optional[bytes]) -> None:
+    try:
+        chunks.put_nowait(item)
+    except queue.Full:
+        # only hop to a thread when the disk writer falls behind
+        await asyncio.to_thread(chunks.put, item)
+
+
+@retry(stop=stop_after_attempt(3), wait=_wait, retry=retry_if_exception(_is_transient), reraise=True)
+async def _fetch(url: str, dest: Path, client: httpx.AsyncClient) -> Path:
+    tmp = dest.with_suffix(dest.suffix + ".part")
+    tmp.parent.mkdir(parents=True, exist_ok=True)
+
+    # bytes left by an earlier failed attempt (or run) are kept and only the rest is
+    # requested; If-Range makes the server send the whole file instead if it changed
+    # since, so bytes of two versions are never spliced together
+    validator = _load_validator(tmp)
+    offset = _partial_size(tmp) if validator else 0
+    request: Dict[str, Any] = {"follow_redirects": True}
+    if offset:
+        request["headers"] = {"Range": f"bytes={offset}-", "If-Range": validator}
+
+    async with client.stream("GET", url, **request) as resp:
+        if offset and resp.status_code == 416:
+            tmp.unlink(missing_ok=True)
+            _validator_path(tmp).unlink(missing_ok=True)
+            raise _StalePartial(f"cannot resume {tmp.name} at byte {offset}")
         resp.raise_for_status()
+        # a changed file, or a server that ignores Range, answers 200 with the whole body: start over then
+        append = bool(offset) and resp.status_code == 206 and resp.headers.get("Content-Range", "").startswith(f"bytes {offset}-")
+        if not append:
+            _save_validator(tmp, resp)
+        # one writer thread per download instead of one executor hop per chunk
+        chunks: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        writer = asyncio.ensure_future(asyncio.to_thread(_write_chunks, tmp, chunks, append))
+        try:
+            # a resumed file's head was already checked by the attempt that wrote it
+            checked = append
+            async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                if not checked:
+                    if not chunk.startswith(PDF_MAGIC):
+                        raise DownloadError("response is not a PDF")
+                    checked = True
+                await _put(chunks, chunk)
+            if not checked:
+                raise DownloadError("empty response")
+        finally:
+            await _put(chunks, None)
+            digest = await writer
 
-        tmp = dest.with_suffix(dest.suffix + ".part")
-        tmp.parent.mkdir(parents=True, exist_ok=True)
+    # Move to final destination atomically, then record its digest
+    sidecar = digest_path(dest)
+    sidecar.unlink(missing_ok=True)
+    os.replace(str(tmp), str(dest))
+    sidecar.write_text(digest, encoding="ascii")
+    _validator_path(tmp).unlink(missing_ok=True)
+    return dest
 
-        async with aiofiles.open(tmp, "wb") as f:
-            async for chunk in resp.aiter_bytes():
-                await f.write(chunk)
 
-        # Move to final destination atomically
-        os.replace(str(tmp), str(dest))
-        return dest
+async def download_pdf(url: str, dest: Path, client: Optional[httpx.AsyncClient] = None) -> Path:
+    """Download a PDF from `url` into `dest` (Path).
+
+    - Streams the body in 64 KB chunks straight to disk instead of buffering it.
+    - Fails fast when the body does not start with the PDF magic bytes (e.g. HTML error pages).
+    - Writes to a temporary `.part` file and atomically replaces the destination on success.
+      If a `.part` file is left from a failed attempt, only the missing bytes are
+      requested (HTTP `Range`) and appended, provided the file is unchanged on the
+      server (`If-Range` with the ETag or Last-Modified of the earlier response).
+    - Records the file's BLAKE3 digest (BLAKE2b without the `blake3` package) in a
+      `<dest>.<HASH_NAME>` sidecar, see `is_intact`.
+    - Uses `client` when given (e.g. the pooled one of an ingest run), else the running
+      loop's shared client (see `arxiv_agent.http.shared_client`).
+    - Retries only transient failures (network errors, 429 and 5xx) with jittered
+      exponential backoff, honoring `Retry-After`; other errors raise `DownloadError` at once.
+    """
+    try:
+        async with borrow_client(client) as c:
+            return await _fetch(url, dest, c)
 
     except Exception as exc:
         raise DownloadError(f"failed to download {url}: {exc}") from exc
-
-    finally:
-        if close_client:
-            await client.aclose()
@@ -5,21 +5,97 @@ and the DB helpers to persist embedding vectors and references.
 """
 from __future__ import annotations
 
+import asyncio
+import functools
+import logging
+import os
+import weakref
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 
-from .nlp import clean_text, get_embedding
-from .db import save_embedding, get_paper_by_arxiv_id
+import anyio
+import numpy as np
 
+from .nlp import OPENAI_MAX_INPUT_TOKENS, clean_text, count_tokens, get_embedding, get_embeddings_batch, openai_request_slices, truncate_tokens
+from .db import init_db, save_embeddings, get_paper_by_arxiv_id
+from .ratelimit import RateLimiter
 
-def _load_text(text_path: str | Path) -> str:
-    p = Path(text_path)
-    if not p.exists():
+logger = logging.getLogger(__name__)
+
+# Papers per batch (one DB write) when `embed_missing` is not given a batch size. A
+# batch is one backend request unless it exceeds OpenAI's per-request token limit.
+DEFAULT_BATCH_SIZE = 256
+
+# Characters of a paper read for embedding, about what each backend's input limit
+# covers at ~4 chars per token (8192 tokens for OpenAI, <=512 for local models).
+# Dense text can still run over: OpenAI rejects such inputs, so they are then cut to
+# the token limit (`truncate_tokens`); local models truncate to their own limit.
+MAX_TEXT_CHARS = {"openai": 8192 * 4, "local": 512 * 4}
+
+
+@functools.lru_cache(maxsize=256)
+def _read_clean_text(path: str, mtime_ns: int, max_chars: Optional[int]) -> str:
+    # `mtime_ns` is only part of the key: a rewritten file gets a fresh entry
+    with open(path, encoding="utf-8") as f:
+        return clean_text(f.read(max_chars) if max_chars else f.read())
+
+
+def _load_text(text_path: str | Path, max_chars: Optional[int] = MAX_TEXT_CHARS["openai"]) -> str:
+    """Cleaned text of the first `max_chars` characters of a file (all of it when None).
+
+    Results are cached per (path, mtime), so re-embedding a paper neither re-reads
+    nor re-cleans an unchanged file.
+    """
+    try:
+        mtime_ns = os.stat(text_path).st_mtime_ns
+    except OSError:
         return ""
-    return p.read_text(encoding="utf-8")
+    return _read_clean_text(os.fspath(text_path), mtime_ns, max_chars)
+
+
+_CPU_LIMITERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, anyio.CapacityLimiter]" = weakref.WeakKeyDictionary()
+
+
+def _cpu_limiter() -> anyio.CapacityLimiter:
+    # limiters are bound to the loop they are first used on; embed_missing runs a new loop per call
+    loop = asyncio.get_running_loop()
+    limiter = _CPU_LIMITERS.get(loop)
+    if limiter is None:
+        limiter = _CPU_LIMITERS[loop] = anyio.CapacityLimiter(os.cpu_count() or 1)
+    return limiter
+
+
+def _load_texts(text_paths: List[Any], max_chars: Optional[int]) -> List[str]:
+    return [_load_text(path, max_chars) for path in text_paths]
+
+
+async def _load_texts_async(text_paths: List[Any], max_chars: Optional[int]) -> List[str]:
+    """Read and clean texts in a worker thread, leaving the event loop free for other batches."""
+    return await anyio.to_thread.run_sync(_load_texts, text_paths, max_chars, limiter=_cpu_limiter())
+
+
+def _fit_texts(texts: List[str], backend: str, model: str, need_counts: bool) -> Tuple[List[str], List[int]]:
+    """Texts cut to the backend's input limit, with their token counts (OpenAI, or if `need_counts`)."""
+    if backend == "openai":
+        fitted = [truncate_tokens(t, OPENAI_MAX_INPUT_TOKENS, model) for t in texts]
+        return [t for t, _ in fitted], [n for _, n in fitted]
+    return texts, [count_tokens(t, model) for t in texts] if need_counts else []
+
+
+def _text_size(text_path: str | Path | None) -> int:
+    try:
+        return os.stat(text_path).st_size if text_path else 0
+    except OSError:
+        return 0
+
+
+def _default_model(backend: str) -> str:
+    return "text-embedding-3-small" if backend == "openai" else "all-MiniLM-L6-v2"
 
 
+@functools.lru_cache(maxsize=4)
 def _get_chroma_client(persist_directory: Optional[str] = None):
+    """Chroma client for `persist_directory`, created once and reused by later calls."""
     try:
         import chromadb
         from chromadb.config import Settings
@@ -36,46 +112,113 @@ async def embed_paper(db_path: str | Path, paper_id: int, arxiv_id: str, text_pa
 
     Returns a dict with embedding id and chroma id (if stored).
     """
-    text = _load_text(text_path)
-    text = clean_text(text)
+    # databases written by older versions need their embeddings table migrated first
+    await init_db(db_path)
+    (text,) = await _load_texts_async([text_path], MAX_TEXT_CHARS.get(backend))
     # choose default models if not provided
-    model_name = model or ("text-embedding-3-small" if backend == "openai" else "all-MiniLM-L6-v2")
+    model_name = model or _default_model(backend)
     vec = get_embedding(text, backend=backend, model=model_name)
 
-    emb_id = await save_embedding(db_path, paper_id, model_name, vec)
+    paper = {"id": paper_id, "arxiv_id": arxiv_id}
+    (res,) = await _store_embeddings(db_path, [paper], [text], [vec], model_name, chroma_dir)
+    return {"embedding_id": res["embedding_id"], "chroma_id": res["chroma_id"]}
 
-    chroma_id = None
+
+def _chroma_add_batch(collection: Any, ids: List[str], vecs: Any, metadatas: List[Dict[str, Any]], documents: List[str]) -> None:
+    """Add a whole batch to `collection` with one call.
+
+    chromadb 0.4 only accepts embeddings as lists of lists: the local backend's float32
+    matrix is converted in a single `tolist` pass, while the lists OpenAI returns are
+    passed through as they are.
+    """
+    embeddings = vecs.tolist() if isinstance(vecs, np.ndarray) else vecs
+    collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+
+async def _store_embeddings(db_path: str | Path, papers: List[Dict[str, Any]], texts: List[str], vecs: Any, model_name: str, chroma_dir: Optional[str], fp16: bool = False) -> List[Dict[str, Any]]:
+    """Persist one vector per paper to the DB (as float16 with `fp16`) and, if `chroma_dir` is set, to Chroma in one `add`."""
+    emb_ids = await save_embeddings(db_path, [(p["id"], model_name, vec) for p, vec in zip(papers, vecs)], fp16=fp16)
+
+    chroma_ids: List[Optional[str]] = [None] * len(papers)
     if chroma_dir:
-        client = _get_chroma_client(chroma_dir)
-        collection = client.get_or_create_collection(name="arxiv_agent")
+        collection = _get_chroma_client(chroma_dir).get_or_create_collection(name="arxiv_agent")
         # use embedding id as the external id
-        ext_id = f"paper-{paper_id}-emb-{emb_id}"
-        collection.add(ids=[ext_id], embeddings=[vec], metadatas=[{"arxiv_id": arxiv_id}], documents=[text[:1000]])
-        chroma_id = ext_id
+        chroma_ids = [f"paper-{p['id']}-emb-{emb_id}" for p, emb_id in zip(papers, emb_ids)]
+        _chroma_add_batch(
+            collection,
+            chroma_ids,
+            vecs,
+            metadatas=[{"arxiv_id": p["arxiv_id"]} for p in papers],
+            documents=[text[:1000] for text in texts],
+        )
+
+    return [
+        {"paper_id": p["id"], "arxiv_id": p["arxiv_id"], "embedding_id": emb_id, "chroma_id": chroma_id}
+        for p, emb_id, chroma_id in zip(papers, emb_ids, chroma_ids)
+    ]
 
-    return {"embedding_id": emb_id, "chroma_id": chroma_id}
+
+async def embed_papers_batch(db_path: str | Path, papers: List[Dict[str, Any]], backend: str = "openai", model: Optional[str] = None, chroma_dir: Optional[str] = None, limiter: Optional[RateLimiter] = None, fp16: bool = False) -> List[Dict[str, Any]]:
+    """Embed several papers with as few backend requests as possible and a single DB write.
+
+    `papers` are rows as returned by `papers_without_embeddings` (`id`, `arxiv_id`,
+    `text_path`). OpenAI batches are split to fit its per-request token limit; if a
+    `limiter` is given, each request waits for its quota first. `fp16=True` stores
+    the vectors as float16 (see `save_embeddings`). Papers with no text
+    are not sent: their result has `embedding_id` None and an `error`.
+    Returns one result dict per paper, in order.
+    """
+    if not papers:
+        return []
+    texts = await _load_texts_async([p["text_path"] for p in papers], MAX_TEXT_CHARS.get(backend))
+    model_name = model or _default_model(backend)
+    # the API rejects empty inputs, which would fail the whole request
+    keep = [i for i, text in enumerate(texts) if text.strip()]
+    if len(keep) < len(papers):
+        logger.warning("skipping %d papers with no text to embed", len(papers) - len(keep))
+    todo, todo_texts = [papers[i] for i in keep], [texts[i] for i in keep]
+
+    stored: List[Dict[str, Any]] = []
+    if todo:
+        todo_texts, counts = await anyio.to_thread.run_sync(_fit_texts, todo_texts, backend, model_name, limiter is not None, limiter=_cpu_limiter())
+        parts = openai_request_slices(counts) if backend == "openai" else [slice(0, len(todo))]
+        vecs: List[Any] = []
+        for part in parts:
+            if limiter is not None:
+                await limiter.acquire(sum(counts[part]))
+            # backends are blocking HTTP / model calls; keep them off the event loop
+            # OpenAI texts are truncated and counted above already; don't do it again
+            extra = {"token_counts": counts[part]} if backend == "openai" else {}
+            vecs.append(await asyncio.to_thread(get_embeddings_batch, todo_texts[part], backend=backend, model=model_name, **extra))
+        stored = await _store_embeddings(db_path, todo, todo_texts, vecs[0] if len(vecs) == 1 else [v for part in vecs for v in part], model_name, chroma_dir, fp16=fp16)
+
+    results = [
+        {"paper_id": p["id"], "arxiv_id": p["arxiv_id"], "embedding_id": None, "chroma_id": None, "error": "no text to embed"}
+        for p in papers
+    ]
+    for i, res in zip(keep, stored):
+        results[i] = res
+    return results
 
 
 def embed_paper_sync(db_path: str | Path, paper_id: int, arxiv_id: str, text_path: str | Path, backend: str = "openai", model: Optional[str] = None, chroma_dir: Optional[str] = None) -> Dict[str, Any]:
     """Synchronous wrapper for `embed_paper`.
 
-    Runs the async `embed_paper` coroutine via `asyncio.run` when no event loop is running.
-    If called from a running event loop, raises a RuntimeError and suggests using the
-    async function directly.
+    Runs the async `embed_paper` coroutine on the calling thread's event loop, so
+    repeated calls from one thread reuse one loop. Calls from several threads share
+    the cached DB connection, whose lock works across threads. If called from a
+    running event loop, raises a RuntimeError and suggests using the async function
+    directly.
     """
-    import asyncio
+    from . import _run
 
     try:
-        loop = asyncio.get_running_loop()
+        asyncio.get_running_loop()
     except RuntimeError:
-        loop = None
-
-    if loop and loop.is_running():
-        raise RuntimeError(
-            "embed_paper_sync cannot be called from a running event loop; use `await embed_paper(...)` instead."
-        )
-
-    return asyncio.run(embed_paper(db_path, paper_id, arxiv_id, text_path, backend=backend, model=model, chroma_dir=chroma_dir))
+        return _run(embed_paper(db_path, paper_id, arxiv_id, text_path, backend=backend, model=model, chroma_dir=chroma_dir))
+    raise RuntimeError(
+        "embed_paper_sync cannot be called from a running event loop; use `await embed_paper(...)` instead."
+    )
 
 
 def embed_missing(
@@ -86,41 +229,60 @@ def embed_missing(
     limit: Optional[int] = None,
     batch_size: Optional[int] = None,
     delay: Optional[float] = None,
+    rpm: Optional[int] = None,
+    tpm: Optional[int] = None,
+    concurrency: int = 1,
+    fp16: bool = False,
 ) -> List[Dict[str, Any]]:
     """Find papers without embeddings and compute/store embeddings for them.
 
-    Supports optional batching to help with rate limits and memory. If `batch_size`
-    is provided, papers are processed in chunks of that size. An optional `delay`
-    (seconds) can be provided to wait between batches.
+    Papers are embedded in chunks of `batch_size` (default 256), each chunk with a
+    single DB write and as few backend requests as the API limits allow. To stay under API quotas, pass
+    `rpm` / `tpm` (requests / tokens per minute): each request then waits just long
+    enough to fit. A fixed `delay` (seconds) between batches is still supported
+    when no quota is given. Up to `concurrency` batches are in flight at once.
+    `fp16=True` stores vectors as float16, half the size of the default float32.
 
     Returns list of results for each paper processed.
     """
-    import asyncio
     from .db import papers_without_embeddings
 
     async def _run():
+        # migrates databases written by older versions; a no-op once done on this connection
+        await init_db(db_path)
         pending = await papers_without_embeddings(db_path)
         if limit:
             pending = pending[:limit]
-        results = []
         total = len(pending)
-        # If no batching requested, process all sequentially
-        if not batch_size or batch_size <= 0:
-            for p in pending:
-                res = await embed_paper(db_path, p["id"], p["arxiv_id"], p["text_path"], backend=backend, model=model, chroma_dir=chroma_dir)
-                results.append({"paper_id": p["id"], "arxiv_id": p["arxiv_id"], **res})
-            return results
-
-        # Process in batches
-        for start in range(0, total, batch_size):
-            batch = pending[start : start + batch_size]
-            for p in batch:
-                res = await embed_paper(db_path, p["id"], p["arxiv_id"], p["text_path"], backend=backend, model=model, chroma_dir=chroma_dir)
-                results.append({"paper_id": p["id"], "arxiv_id": p["arxiv_id"], **res})
-            # delay between batches if requested
-            if delay and (start + batch_size) < total:
-                await asyncio.sleep(delay)
+        size = batch_size if batch_size and batch_size > 0 else DEFAULT_BATCH_SIZE
+        # Local models pad every text in a batch to its longest one, so batch papers of
+        # similar length together; results keep DB order. File size is a free proxy
+        # for length, capped at what is read: longer files all embed at the same length.
+        order = list(range(total))
+        if backend == "local":
+            cap = MAX_TEXT_CHARS["local"]
+            order.sort(key=lambda i: min(_text_size(pending[i]["text_path"]), cap))
+            pending = [pending[i] for i in order]
+        limiter = RateLimiter(rpm=rpm, tpm=tpm) if (rpm or tpm) else None
+        sem = asyncio.Semaphore(max(1, concurrency))
 
+        async def _one(start: int) -> List[Dict[str, Any]]:
+            async with sem:
+                batch = pending[start : start + size]
+                res = await embed_papers_batch(db_path, batch, backend=backend, model=model, chroma_dir=chroma_dir, limiter=limiter, fp16=fp16)
+                # fixed delay between batches if requested and no quota-based limiter
+                if delay and limiter is None and (start + size) < total:
+                    await asyncio.sleep(delay)
+                return res
+
+        batches = await asyncio.gather(*(_one(start) for start in range(0, total, size)))
+        results: List[Dict[str, Any]] = [{}] * total
+        for i, r in zip(order, (r for batch in batches for r in batch)):
+            results[i] = r
         return results
 
-    return asyncio.run(_run())
+    try:
+        return asyncio.run(_run())
+    finally:
+        # texts are not needed once their vectors are stored
+        _read_clean_text.cache_clear()
@@ -0,0 +1,57 @@
+"""Shared HTTP client settings for arxiv-agent.
+
+`search_arxiv` and `download_pdf` use the client they are given, else the pooled
+client of the running event loop (`shared_client`), so repeated calls on one loop
+(including the sync wrappers, which reuse their thread's loop) pay one TLS handshake
+per host and can multiplex over HTTP/2. `ingest_query` opens its own client per run
+(`new_client`) and closes it when the run ends.
+"""
+from __future__ import annotations
+
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Tuple
+
+import httpx
+
+
+TIMEOUT = 60.0
+LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+
+_SHARED: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[AsyncIterator[None], httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+
+
+def new_client() -> httpx.AsyncClient:
+    """A pooled HTTP/2 client; the caller owns it and must close it (`async with`)."""
+    return httpx.AsyncClient(timeout=TIMEOUT, http2=True, limits=LIMITS)
+
+
+async def _close_at_shutdown(client: httpx.AsyncClient) -> AsyncIterator[None]:
+    # a suspended async generator is finalized by loop.shutdown_asyncgens(), which
+    # asyncio.run and asyncio.Runner.close call before closing the loop
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+async def shared_client() -> httpx.AsyncClient:
+    """The pooled client of the running event loop, created on first use.
+
+    It is closed when the loop shuts down (end of `asyncio.run`, `asyncio.Runner.close`).
+    """
+    loop = asyncio.get_running_loop()
+    entry = _SHARED.get(loop)
+    if entry is None or entry[1].is_closed:
+        client = new_client()
+        closer = _close_at_shutdown(client)
+        entry = _SHARED[loop] = (closer, client)
+        await closer.__anext__()
+    return entry[1]
+
+
+@asynccontextmanager
+async def borrow_client(client: Optional[httpx.AsyncClient] = None) -> AsyncIterator[httpx.AsyncClient]:
+    """Yield `client` unchanged, or the running loop's shared client; neither is closed on exit."""
+    yield client if client is not None else await shared_client()
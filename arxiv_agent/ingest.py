@@ -1,7 +1,7 @@
 """Minimal ingestion pipeline for arxiv-agent.
 
 This module provides:
-- `search_arxiv` - async wrapper around the `arxiv` package to get metadata
+- `search_arxiv` - async query of the arXiv Atom API returning normalized metadata
 - `extract_text` - extract text from a local PDF using PyMuPDF
 - `ingest_query` - end-to-end flow: search -> download -> extract -> return results
 
@@ -10,104 +10,256 @@ The implementation keeps I/O async-friendly and small so it is easy to test.
 from __future__ import annotations
 
 import asyncio
+import atexit
+import logging
+import multiprocessing
+import os
 import re
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import AsyncExitStack
 from pathlib import Path
 from typing import List, Dict, Any
 
-import arxiv
 import fitz  # PyMuPDF
+import httpx
 
 from .models import PaperMetadata
-from .downloader import download_pdf
-from .db import init_db, upsert_paper, set_processing
+from .http import borrow_client, new_client
+from .downloader import PDF_MAGIC, download_pdf, is_intact
+from .db import INSERT_PROCESSING, WriteBatcher, get_papers_by_arxiv_ids, init_db, upsert_paper_and_mark, upsert_papers_bulk
 
 
-_ARXIV_ID_RE = re.compile(r"([^/]+v?\d*)(?:\.pdf)?$")
+logger = logging.getLogger(__name__)
+
+_ARXIV_ID_RE = re.compile(r"(?:abs|pdf)/([^/?#]+?)(?:v\d+)?(?:\.pdf)?$")
+_ID_SUFFIX_RE = re.compile(r"(?:v\d+)?(?:\.pdf)?$")
+_VERSION_RE = re.compile(r"v\d+$")
+_TITLE_NORM_RE = re.compile(r"[^\w]+")
 
 
 def _extract_arxiv_id(entry_id: str) -> str:
+    """Canonical (version-less) arXiv id from an entry id or abs/pdf URL.
+
+    >>> _extract_arxiv_id("http://arxiv.org/abs/2101.00001v2")
+    '2101.00001'
+    >>> _extract_arxiv_id("https://arxiv.org/pdf/2101.00001v1.pdf")
+    '2101.00001'
+    >>> _extract_arxiv_id("2101.00001")
+    '2101.00001'
+    """
     if not entry_id:
         return ""
     m = _ARXIV_ID_RE.search(entry_id)
     if m:
         return m.group(1)
-    return entry_id.rstrip("/").split("/")[-1]
+    return _ID_SUFFIX_RE.sub("", entry_id.rstrip("/").split("/")[-1])
 
 
-async def search_arxiv(query: str, max_results: int = 10) -> List[PaperMetadata]:
-    """Search arXiv and return a list of normalized PaperMetadata.
+def _completeness(meta: PaperMetadata) -> tuple[bool, int]:
+    return meta.summary is not None, len(meta.title or "")
+
+
+def _dedupe_by(metas: List[PaperMetadata], key) -> List[PaperMetadata]:
+    # keeps first-seen order; on collision the more complete entry wins the slot
+    kept: Dict[str, int] = {}
+    unique: List[PaperMetadata] = []
+    for m in metas:
+        k = key(m)
+        if not k:
+            unique.append(m)
+        elif k not in kept:
+            kept[k] = len(unique)
+            unique.append(m)
+        elif _completeness(m) > _completeness(unique[kept[k]]):
+            unique[kept[k]] = m
+    return unique
 
-    The `arxiv` package used here is synchronous, so we run it in a thread.
+
+def dedupe_metas(metas: List[PaperMetadata]) -> List[PaperMetadata]:
+    """Drop duplicate hits: first by version-less arXiv id, then by normalized title.
+
+    When two entries collide, the one with a summary (then the longer title) is kept.
     """
+    unique = _dedupe_by(metas, lambda m: _VERSION_RE.sub("", m.arxiv_id))
+    unique = _dedupe_by(unique, lambda m: _TITLE_NORM_RE.sub("", (m.title or "").lower()))
+    if len(unique) < len(metas):
+        logger.info("dropped %d duplicate arXiv hits", len(metas) - len(unique))
+    return unique
+
+
+ARXIV_API_URL = "https://export.arxiv.org/api/query"
+_ATOM_NS = {"a": "http://www.w3.org/2005/Atom", "arxiv": "http://arxiv.org/schemas/atom"}
+
 
-    def _sync_search() -> List[Any]:
-        search = arxiv.Search(query=query, max_results=max_results)
-        return list(search.results())
+def _text(entry: ET.Element, path: str) -> str | None:
+    node = entry.find(path, _ATOM_NS)
+    if node is None or node.text is None:
+        return None
+    # Atom titles/summaries are hard-wrapped; collapse the wrapping whitespace
+    return " ".join(node.text.split())
 
-    results = await asyncio.to_thread(_sync_search)
+
+def parse_atom_feed(content: bytes) -> List[PaperMetadata]:
+    """Parse an arXiv API Atom feed into PaperMetadata; an API error entry raises ValueError."""
     metas: List[PaperMetadata] = []
-    for r in results:
-        # r is an arxiv.Result object; access attributes with fallbacks to be robust.
-        entry_id = getattr(r, "entry_id", None) or getattr(r, "id", None) or ""
+    for entry in ET.fromstring(content).iterfind("a:entry", _ATOM_NS):
+        entry_id = _text(entry, "a:id") or ""
+        if "/api/errors" in entry_id:
+            raise ValueError(f"arXiv API error: {_text(entry, 'a:summary')}")
         arxiv_id = _extract_arxiv_id(entry_id)
-        title = getattr(r, "title", None) or ""
-        authors_raw = getattr(r, "authors", []) or []
-        authors = [a.name if hasattr(a, "name") else str(a) for a in authors_raw]
-        summary = getattr(r, "summary", None)
-        published = getattr(r, "published", None)
-        pdf_url = getattr(r, "pdf_url", f"https://arxiv.org/pdf/{arxiv_id}.pdf")
-
-        meta = PaperMetadata(
-            arxiv_id=arxiv_id,
-            title=title,
-            authors=authors,
-            summary=summary,
-            published=published,
-            pdf_url=pdf_url,
-            raw={"entry_id": entry_id},
+        pdf_url = next(
+            (link.get("href") for link in entry.iterfind("a:link", _ATOM_NS) if link.get("title") == "pdf"),
+            f"https://arxiv.org/pdf/{arxiv_id}.pdf",
+        )
+        metas.append(
+            PaperMetadata(
+                arxiv_id=arxiv_id,
+                title=_text(entry, "a:title") or "",
+                authors=[name.text.strip() for name in entry.iterfind("a:author/a:name", _ATOM_NS) if name.text],
+                summary=_text(entry, "a:summary"),
+                published=_text(entry, "a:published"),
+                pdf_url=pdf_url,
+                raw={"entry_id": entry_id},
+            )
         )
-        metas.append(meta)
-
     return metas
 
 
+async def search_arxiv(query: str, max_results: int = 10, client: httpx.AsyncClient | None = None) -> List[PaperMetadata]:
+    """Search arXiv and return a list of normalized PaperMetadata.
+
+    Queries the arXiv Atom API directly over `client` (the running loop's shared
+    client when omitted), so searches do not tie up a worker thread.
+    """
+    async with borrow_client(client) as c:
+        resp = await c.get(
+            ARXIV_API_URL,
+            params={"search_query": query, "max_results": max_results},
+            follow_redirects=True,
+        )
+    resp.raise_for_status()
+    return parse_atom_feed(resp.content)
+
+
+# Only clip to the page box: skipping ligature/whitespace preservation and block
+# sorting keeps MuPDF on its cheapest plain-text path.
+_TEXT_FLAGS = fitz.TEXT_MEDIABOX_CLIP
+
+
 def extract_text_sync(pdf_path: Path) -> str:
     """Extract plain text from a PDF file using PyMuPDF (synchronous)."""
-    doc = fitz.open(str(pdf_path))
-    parts: List[str] = []
-    for page in doc:
-        parts.append(page.get_text("text"))
-    doc.close()
+    with fitz.open(str(pdf_path)) as doc:
+        parts: List[str] = [""] * doc.page_count
+        for i, page in enumerate(doc):
+            parts[i] = page.get_text("text", flags=_TEXT_FLAGS, sort=False)
     return "\n".join(parts)
 
 
+_PDF_POOL: ProcessPoolExecutor | None = None
+# Set when worker processes cannot start at all; PDFs are then parsed in threads.
+_PDF_IN_THREADS = False
+
+
+def _pdf_pool() -> ProcessPoolExecutor:
+    global _PDF_POOL
+    if _PDF_POOL is None:
+        # forking a process that runs an event loop and threads can copy held locks
+        # into the child; start workers from a clean process instead
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _PDF_POOL = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context(method))
+        atexit.register(_PDF_POOL.shutdown, wait=False)
+    return _PDF_POOL
+
+
+def _drop_pool(pool: ProcessPoolExecutor) -> None:
+    global _PDF_POOL
+    if _PDF_POOL is pool:
+        _PDF_POOL = None
+        pool.shutdown(wait=False)
+
+
+async def _workers_start() -> bool:
+    """True if a fresh pool can run a trivial task, i.e. a broken pool was a worker crash."""
+    try:
+        pool = _pdf_pool()
+    except (OSError, NotImplementedError):
+        return False
+    try:
+        await asyncio.get_running_loop().run_in_executor(pool, int)
+        return True
+    except BrokenProcessPool:
+        _drop_pool(pool)
+        return False
+
+
 async def extract_text(pdf_path: Path) -> str:
-    return await asyncio.to_thread(extract_text_sync, pdf_path)
+    """Extract text in a worker process so CPU-bound PDF parsing uses every core.
+
+    Workers re-import the main module; if they cannot start (e.g. a script without an
+    ``if __name__ == "__main__":`` guard), PDFs are parsed in threads instead.
+    """
+    global _PDF_IN_THREADS
+    if not _PDF_IN_THREADS:
+        try:
+            pool = _pdf_pool()
+        except (OSError, NotImplementedError):
+            # no process support on this platform
+            pool = None
+        if pool is not None:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(pool, extract_text_sync, str(pdf_path))
+            except BrokenProcessPool:
+                _drop_pool(pool)
+                if await _workers_start():
+                    # a worker died (e.g. MuPDF crashed on a corrupt file); this paper
+                    # fails, later ones use the fresh pool
+                    raise
+        if not _PDF_IN_THREADS:
+            logger.warning("PDF worker processes cannot start; extracting text in threads")
+            _PDF_IN_THREADS = True
+    return await asyncio.to_thread(extract_text_sync, str(pdf_path))
 
 
-async def ingest_query(query: str, max_results: int = 10, output_dir: Path | str = "downloads", concurrency: int = 3, db_path: str | Path | None = None) -> List[Dict[str, Any]]:
+def _is_pdf(path: Path) -> bool:
+    try:
+        with path.open("rb") as f:
+            return f.read(len(PDF_MAGIC)) == PDF_MAGIC
+    except OSError:
+        return False
+
+
+def _have_pdf(path: Path) -> bool:
+    """True if `path` is a PDF that matches its recorded digest."""
+    return _is_pdf(path) and is_intact(path)
+
+
+def _has_text(path: Path) -> bool:
+    try:
+        return path.stat().st_size > 0
+    except OSError:
+        return False
+
+
+async def ingest_query(query: str, max_results: int = 10, output_dir: Path | str = "downloads", concurrency: int = 3, db_path: str | Path | None = None, force: bool = False) -> List[Dict[str, Any]]:
     """End-to-end ingestion: search -> download PDFs -> extract text.
 
+    PDFs and extracted texts already present in `output_dir` are reused, so re-running
+    a query only fetches new papers. With `db_path`, papers whose recorded text file
+    still exists are returned as-is without touching them or the DB. Pass `force=True`
+    to download and extract again.
+
     Returns a list of result dictionaries containing `meta` (PaperMetadata),
     `pdf_path` (Path) and `text_path` (Path).
     """
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    metas = await search_arxiv(query, max_results=max_results)
-
-    if db_path:
-        await init_db(db_path)
-
-    # Deduplicate by arXiv id to avoid downloading the same paper twice.
-    seen: set[str] = set()
-    unique_metas: List[PaperMetadata] = []
-    for m in metas:
-        if m.arxiv_id not in seen:
-            seen.add(m.arxiv_id)
-            unique_metas.append(m)
-
     sem = asyncio.Semaphore(concurrency)
+    batcher: WriteBatcher | None = None
+    paper_ids: Dict[str, int] = {}
+    client: httpx.AsyncClient | None = None
 
     async def _handle(meta: PaperMetadata) -> Dict[str, Any]:
         async with sem:
@@ -115,32 +267,63 @@ async def ingest_query(query: str, max_results: int = 10, output_dir: Path | str
             text_path = output_dir / "texts" / f"{meta.arxiv_id}.txt"
             text_path.parent.mkdir(parents=True, exist_ok=True)
 
-            paper_id = None
-            if db_path:
-                # upsert before downloading so paper record exists
-                paper_id = await upsert_paper(db_path, meta)
-                await set_processing(db_path, paper_id, "download", "pending")
+            paper_id = paper_ids.get(meta.arxiv_id)
             try:
                 # download
-                url = meta.pdf_url or f"https://arxiv.org/pdf/{meta.arxiv_id}.pdf"
-                await download_pdf(url, pdf_path)
+                # hashing a whole PDF is blocking file I/O; keep it off the event loop
+                if force or not await asyncio.to_thread(_have_pdf, pdf_path):
+                    url = meta.pdf_url or f"https://arxiv.org/pdf/{meta.arxiv_id}.pdf"
+                    await download_pdf(url, pdf_path, client=client)
                 # extract
-                text = await extract_text(pdf_path)
-                text_path.write_text(text, encoding="utf-8")
+                if force or not _has_text(text_path):
+                    text = await extract_text(pdf_path)
+                    text_path.write_text(text, encoding="utf-8")
 
                 if db_path and paper_id:
                     # update record with paths and mark stages
-                    await upsert_paper(db_path, meta, pdf_path=str(pdf_path), text_path=str(text_path))
-                    await set_processing(db_path, paper_id, "download", "success")
-                    await set_processing(db_path, paper_id, "extract", "success")
+                    await upsert_paper_and_mark(db_path, meta, "download", "success", pdf_path=str(pdf_path), text_path=str(text_path))
+                    batcher.submit(INSERT_PROCESSING, (paper_id, "extract", "success", None))
 
                 return {"meta": meta, "pdf_path": pdf_path, "text_path": text_path, "success": True, "error": None}
             except Exception as exc:
                 # Don't fail the whole ingestion run for one paper; record the error.
                 if db_path and paper_id:
-                    await set_processing(db_path, paper_id, "download", "error", error=str(exc))
+                    batcher.submit(INSERT_PROCESSING, (paper_id, "download", "error", str(exc)))
                 return {"meta": meta, "pdf_path": pdf_path, "text_path": text_path, "success": False, "error": str(exc)}
 
-    tasks = [asyncio.create_task(_handle(m)) for m in unique_metas]
-    results = await asyncio.gather(*tasks)
-    return results
+    async with AsyncExitStack() as stack:
+        # one pooled client for the whole run so the search and each download reuse
+        # kept-alive connections; closed with the stack when the run ends
+        client = await stack.enter_async_context(new_client())
+        metas = await search_arxiv(query, max_results=max_results, client=client)
+
+        if db_path:
+            await init_db(db_path)
+
+        # Deduplicate (arXiv id ignoring version, then title) to avoid downloading the same paper twice.
+        unique_metas = dedupe_metas(metas)
+
+        done: Dict[str, Dict[str, Any]] = {}
+        if db_path and not force:
+            # papers the DB already holds extracted text for need no download, extract or write
+            known = await get_papers_by_arxiv_ids(db_path, [m.arxiv_id for m in unique_metas])
+            for m in unique_metas:
+                row = known.get(m.arxiv_id)
+                if row and row["text_path"] and _has_text(Path(row["text_path"])):
+                    pdf = Path(row["pdf_path"]) if row["pdf_path"] else output_dir / f"{m.arxiv_id}.pdf"
+                    done[m.arxiv_id] = {"meta": m, "pdf_path": pdf, "text_path": Path(row["text_path"]), "success": True, "error": None}
+            if done:
+                logger.info("skipping %d papers already ingested", len(done))
+        todo = [m for m in unique_metas if m.arxiv_id not in done]
+
+        if db_path and todo:
+            # create every paper record (marked pending) in one transaction before downloading
+            ids = await upsert_papers_bulk(db_path, [(m, None, None) for m in todo], "download", "pending")
+            paper_ids = dict(zip((m.arxiv_id for m in todo), ids))
+            # status rows that nothing waits on are coalesced across papers
+            batcher = await stack.enter_async_context(WriteBatcher(db_path))
+        # _handle turns per-paper failures into result dicts, so one bad paper never
+        # cancels its siblings; anything else (e.g. cancellation) tears the group down
+        async with asyncio.TaskGroup() as tg:
+            tasks = {m.arxiv_id: tg.create_task(_handle(m)) for m in todo}
+    return [done[m.arxiv_id] if m.arxiv_id in done else tasks[m.arxiv_id].result() for m in unique_metas]
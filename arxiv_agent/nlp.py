@@ -9,9 +9,31 @@ required libraries or keys are not available.
 """
 from __future__ import annotations
 
+import functools
 import os
 import re
-from typing import List
+from typing import Any, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+_CR_RE = re.compile(r"\r\n|\r")
+# Only runs of 2+ spaces match, so single spaces (almost all of them) are not rewritten.
+_WS_RE = re.compile(r" {2,}")
+_NL_RE = re.compile(r"\n{3,}")
+# Tabs and non-breaking spaces become spaces; zero-width chars, the BOM and C0 control
+# chars other than \n and \r are dropped.
+_CLEAN_TABLE = str.maketrans(
+    {
+        "\t": " ",
+        "\xa0": " ",
+        "\u200b": None,
+        "\u200c": None,
+        "\u200d": None,
+        "\ufeff": None,
+        **{chr(c): None for c in (*range(0x00, 0x09), *range(0x0B, 0x20)) if c != 0x0D},
+    }
+)
 
 
 def clean_text(text: str) -> str:
@@ -19,42 +41,62 @@ def clean_text(text: str) -> str:
     if text is None:
         return ""
     # Replace non-breaking spaces and control chars
-    text = text.replace("\xa0", " ")
+    text = text.translate(_CLEAN_TABLE)
     # Normalize line endings and collapse multiple spaces
-    text = re.sub(r"\r\n|\r", "\n", text)
-    text = re.sub(r"[ \t]+", " ", text)
+    if "\r" in text:
+        text = _CR_RE.sub("\n", text)
+    if "  " in text:
+        text = _WS_RE.sub(" ", text)
     # Strip excessive blank lines
-    text = re.sub(r"\n{3,}", "\n\n", text)
+    if "\n\n\n" in text:
+        text = _NL_RE.sub("\n\n", text)
     return text.strip()
 
 
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize_iter(text: str) -> Iterator[str]:
+    """Lazily yield word tokens, without building the full list for long documents."""
+    if not text:
+        return iter(())
+    return (m.group() for m in _TOKEN_RE.finditer(text))
+
+
 def tokenize(text: str) -> List[str]:
     """Very small tokenizer splitting on whitespace and punctuation."""
     if not text:
         return []
     # keep words and simple punctuation splitting
-    tokens = re.findall(r"\w+", text)
-    return tokens
+    return _TOKEN_RE.findall(text)
 
 
-def get_embedding_openai(text: str, model: str = "text-embedding-3-small") -> List[float]:
-    """Get embedding from OpenAI. Requires OPENAI_API_KEY environment variable."""
+@functools.lru_cache(maxsize=2)
+def _openai_client(api_key: str):
+    """One OpenAI client per key, so its HTTP connection pool is reused across calls."""
     try:
         import openai
     except Exception as e:
         raise RuntimeError("openai package is required for OpenAI embeddings") from e
 
+    return openai.OpenAI(api_key=api_key)
+
+
+def _openai() -> Any:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY not set in environment")
-    openai.api_key = api_key
+    return _openai_client(api_key)
 
-    resp = openai.Embedding.create(input=text, model=model)
-    return resp["data"][0]["embedding"]
 
+def get_embedding_openai(text: str, model: str = "text-embedding-3-small") -> List[float]:
+    """Get embedding from OpenAI. Requires OPENAI_API_KEY environment variable."""
+    return get_embeddings_openai([text], model=model)[0]
 
-def get_embedding_local(text: str, model_name: str = "all-MiniLM-L6-v2") -> List[float]:
-    """Get embedding using sentence-transformers installed locally.
+
+@functools.lru_cache(maxsize=4)
+def _st_model(model_name: str):
+    """Load a SentenceTransformer once per model name and keep it for later calls.
 
     This function lazily imports SentenceTransformer and will raise a clear
     error if the package is not installed.
@@ -64,12 +106,103 @@ def get_embedding_local(text: str, model_name: str = "all-MiniLM-L6-v2") -> List
     except Exception as e:
         raise RuntimeError("sentence-transformers is not installed; install it for local embeddings") from e
 
-    model = SentenceTransformer(model_name)
-    vec = model.encode(text)
+    return SentenceTransformer(model_name)
+
+
+def get_embedding_local(text: str, model_name: str = "all-MiniLM-L6-v2") -> List[float]:
+    """Get embedding using sentence-transformers installed locally.
+
+    The model is loaded on first use and cached (see `_st_model`).
+    """
+    vec = _st_model(model_name).encode(text, convert_to_numpy=True, normalize_embeddings=True)
     # ensure python float list
     return [float(x) for x in vec]
 
 
+@functools.lru_cache(maxsize=8)
+def _token_encoding(model: str):
+    try:
+        import tiktoken
+    except Exception:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "text-embedding-3-small") -> int:
+    """Number of tokens `model` sees for `text`.
+
+    Uses `tiktoken` when installed, otherwise estimates ~4 characters per token.
+    """
+    enc = _token_encoding(model)
+    if enc is None:
+        return len(text) // 4 + 1
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "text-embedding-3-small") -> Tuple[str, int]:
+    """`text` cut to at most `max_tokens` tokens of `model`, and its token count.
+
+    Without `tiktoken` both are estimated at ~4 characters per token, as in `count_tokens`.
+    """
+    enc = _token_encoding(model)
+    if enc is None:
+        text = text[: max_tokens * 4]
+        return text, min(count_tokens(text, model), max_tokens)
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text, len(tokens)
+    return enc.decode(tokens[:max_tokens]), max_tokens
+
+
+# The embeddings endpoint rejects inputs longer than this many tokens, and accepts at
+# most this many inputs, and this many tokens over all inputs, per request.
+OPENAI_MAX_INPUT_TOKENS = 8192
+OPENAI_MAX_INPUTS = 2048
+OPENAI_MAX_REQUEST_TOKENS = 300_000
+
+
+def openai_request_slices(token_counts: List[int]) -> List[slice]:
+    """Split inputs with these token counts into consecutive slices, one per request,
+    each within `OPENAI_MAX_INPUTS` inputs and `OPENAI_MAX_REQUEST_TOKENS` tokens.
+    """
+    slices: List[slice] = []
+    start, tokens = 0, 0
+    for i, n in enumerate(token_counts):
+        if i > start and (i - start >= OPENAI_MAX_INPUTS or tokens + n > OPENAI_MAX_REQUEST_TOKENS):
+            slices.append(slice(start, i))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(token_counts):
+        slices.append(slice(start, len(token_counts)))
+    return slices
+
+
+def get_embeddings_openai(texts: List[str], model: str = "text-embedding-3-small", token_counts: Optional[List[int]] = None) -> List[List[float]]:
+    """Embed several texts with as few OpenAI requests as the per-request limits allow.
+
+    Texts longer than `OPENAI_MAX_INPUT_TOKENS` are truncated to it first, unless the
+    caller already did so and passes the resulting `token_counts`.
+    """
+    client = _openai()
+    if token_counts is None:
+        fitted = [truncate_tokens(t, OPENAI_MAX_INPUT_TOKENS, model) for t in texts]
+        texts, token_counts = [t for t, _ in fitted], [n for _, n in fitted]
+    vectors: List[List[float]] = []
+    for part in openai_request_slices(token_counts):
+        resp = client.embeddings.create(input=texts[part], model=model)
+        vectors.extend(d.embedding for d in sorted(resp.data, key=lambda d: d.index))
+    return vectors
+
+
+def get_embeddings_local(texts: List[str], model_name: str = "all-MiniLM-L6-v2", batch_size: int = 64) -> np.ndarray:
+    """Embed several texts with one batched `encode` call. Returns a `(len, dim)` float32 array."""
+    vecs = _st_model(model_name).encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+    return vecs.astype(np.float32, copy=False)
+
+
 def get_embedding(text: str, backend: str = "openai", **kwargs) -> List[float]:
     """Unified embedding interface. backend is 'openai' or 'local'.
 
@@ -81,3 +214,20 @@ def get_embedding(text: str, backend: str = "openai", **kwargs) -> List[float]:
     if backend == "local":
         return get_embedding_local(text, model_name=model) if model else get_embedding_local(text)
     raise ValueError("unknown backend for embeddings")
+
+
+def get_embeddings_batch(texts: List[str], backend: str = "openai", **kwargs) -> List[List[float]] | np.ndarray:
+    """Batched counterpart of `get_embedding`: one vector per input text, in order.
+
+    The local backend returns a `(len(texts), dim)` float32 array. For OpenAI,
+    `token_counts` marks the texts as already truncated (see `get_embeddings_openai`).
+    """
+    if not texts:
+        return []
+    model = kwargs.get("model")
+    if backend == "openai":
+        token_counts = kwargs.get("token_counts")
+        return get_embeddings_openai(texts, model=model, token_counts=token_counts) if model else get_embeddings_openai(texts, token_counts=token_counts)
+    if backend == "local":
+        return get_embeddings_local(texts, model_name=model) if model else get_embeddings_local(texts)
+    raise ValueError("unknown backend for embeddings")
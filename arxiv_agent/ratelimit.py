@@ -0,0 +1,47 @@
+"""Client-side rate limiting for API calls.
+
+`RateLimiter` keeps requests and tokens within per-minute quotas by waiting *before*
+a call would exceed them, instead of sleeping a fixed delay or reacting to 429s.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+
+class RateLimiter:
+    """Sliding-window limiter for requests per minute (`rpm`) and tokens per minute (`tpm`).
+
+    Either quota may be None to leave it unbounded. Create it inside the event loop
+    that will call `acquire`.
+    """
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None, window: float = 60.0) -> None:
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self._calls: Deque[Tuple[float, int]] = deque()
+        self._tokens = 0
+        self._lock = asyncio.Lock()
+
+    def _expire(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] >= self.window:
+            _, tokens = self._calls.popleft()
+            self._tokens -= tokens
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until one more request carrying `tokens` tokens fits in the quotas."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                fits_requests = self.rpm is None or len(self._calls) < self.rpm
+                # a single oversized request is let through once the window is empty
+                fits_tokens = self.tpm is None or not self._calls or self._tokens + tokens <= self.tpm
+                if fits_requests and fits_tokens:
+                    self._calls.append((now, tokens))
+                    self._tokens += tokens
+                    return
+                await asyncio.sleep(self._calls[0][0] + self.window - now)
@@ -45,8 +45,6 @@ def _():
     import asyncio
     from pathlib import Path
 
-    import nest_asyncio
-
     # high-level helpers exposed by the package
     from arxiv_agent import ingest_query, download_pdf, extract_text, search_arxiv
     from arxiv_agent.embeddings import embed_paper, embed_paper_sync, embed_missing
@@ -58,8 +56,6 @@ def _():
     from arxiv_agent.models import PaperMetadata
 
     print("imports OK")
-
-    nest_asyncio.apply()
     return (
         Path,
         asyncio,
@@ -84,7 +80,7 @@ def _(mo):
 
 
 @app.cell
-def _(Path, asyncio, download_pdf):
+async def _(Path, download_pdf):
     async def demo_download():
         url = "https://arxiv.org/pdf/2101.00001.pdf"
         dest = Path("downloads/2101.00001.pdf")
@@ -93,8 +89,8 @@ def _(Path, asyncio, download_pdf):
         print("saved ->", dest)
 
 
-    # Run example interactively when ready:
-    asyncio.run(demo_download())
+    # Run example interactively when ready (marimo awaits top-level `await` in cells):
+    await demo_download()
     return
 
 
@@ -111,7 +107,7 @@ def _(mo):
 
 
 @app.cell
-def _(asyncio, ingest_query):
+async def _(ingest_query):
     async def demo_ingest():
         # Searches arXiv and writes downloads + extracted text into 'downloads/'
         results = await ingest_query(
@@ -126,8 +122,8 @@ def _(asyncio, ingest_query):
             print("-", meta.arxiv_id, meta.title)
 
 
-    # Run interactively: 
-    asyncio.run(demo_ingest())
+    # Run interactively:
+    await demo_ingest()
     return
 
 
@@ -142,7 +138,7 @@ def _(mo):
 
 
 @app.cell
-def _(asyncio, get_embeddings_for_paper, get_paper_by_arxiv_id, init_db):
+async def _(get_embeddings_for_paper, get_paper_by_arxiv_id, init_db):
     async def db_inspect():
         await init_db("data/arxiv.db")  # idempotent init
         # retrieve a known paper by arXiv id
@@ -153,8 +149,8 @@ def _(asyncio, get_embeddings_for_paper, get_paper_by_arxiv_id, init_db):
             embs = await get_embeddings_for_paper("data/arxiv.db", paper["id"])
             print("embeddings for paper:", embs)
 
-    # Run interactively: 
-    asyncio.run(db_inspect())
+    # Run interactively:
+    await db_inspect()
     return
 
 
@@ -171,7 +167,7 @@ def _(mo):
 
 
 @app.cell
-def _(Path, asyncio, embed_paper, embed_paper_sync):
+async def _(Path, asyncio, embed_paper, embed_paper_sync):
     async def demo_embed_async():
         # embed a single paper (async)
         res = await embed_paper(
@@ -197,9 +193,10 @@ def _(Path, asyncio, embed_paper, embed_paper_sync):
         print("embed result (sync) ->", res)
 
 
-    # Run examples interactively:
-    asyncio.run(demo_embed_async())
-    demo_embed_sync()
+    # Run examples interactively. The notebook's event loop is already running, so the
+    # sync wrapper is called from a worker thread, as a plain script would call it.
+    await demo_embed_async()
+    await asyncio.to_thread(demo_embed_sync)
     return
 
 
@@ -0,0 +1,14 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def loop():
+    """One event loop shared by a module's synchronous tests.
+
+    `loop.run_until_complete` avoids the setup and teardown `asyncio.run` pays per call.
+    """
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
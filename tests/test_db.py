@@ -1,9 +1,10 @@
 import asyncio
 from pathlib import Path
 
+import numpy as np
 import pytest
 
-from arxiv_agent.db import init_db, upsert_paper, get_paper_by_arxiv_id, set_processing, list_pending
+from arxiv_agent.db import init_db, upsert_paper, get_paper_by_arxiv_id, set_processing, list_pending, get_conn, upsert_paper_and_mark, WriteBatcher, INSERT_PROCESSING, save_embedding, get_embeddings_for_paper, upsert_papers_bulk
 from arxiv_agent.models import PaperMetadata
 
 
@@ -28,3 +29,196 @@ async def test_processing_and_list_pending(tmp_path: Path):
     await set_processing(db, pid, "extract", "pending")
     pending = await list_pending(db, stage="extract")
     assert any(p["arxiv_id"] == "2101.00011" for p in pending)
+
+
+@pytest.mark.asyncio
+async def test_get_conn_is_cached(tmp_path: Path):
+    db = tmp_path / "conn.db"
+    conn = await get_conn(db)
+    assert await get_conn(str(db)) is conn
+    # helpers also accept an open connection
+    await init_db(conn)
+    pid = await upsert_paper(conn, PaperMetadata(arxiv_id="2101.00012", title="Conn Paper"))
+    rec = await get_paper_by_arxiv_id(db, "2101.00012")
+    assert rec["id"] == pid
+
+
+@pytest.mark.asyncio
+async def test_upsert_and_mark_with_batched_writes(tmp_path: Path):
+    db = tmp_path / "batch.db"
+    await init_db(db)
+    meta = PaperMetadata(arxiv_id="2101.00013", title="Batch Paper")
+    pid = await upsert_paper_and_mark(db, meta, "download", "pending")
+    async with WriteBatcher(db, max_rows=2) as batcher:
+        batcher.submit(INSERT_PROCESSING, (pid, "extract", "pending", None))
+        batcher.submit(INSERT_PROCESSING, (pid, "embed", "pending", None))
+        batcher.submit(INSERT_PROCESSING, (pid, "summary", "pending", None))
+    assert any(p["id"] == pid for p in await list_pending(db, stage="download"))
+    assert any(p["id"] == pid for p in await list_pending(db, stage="extract"))
+    assert any(p["id"] == pid for p in await list_pending(db, stage="summary"))
+
+
+@pytest.mark.asyncio
+async def test_embeddings_stored_as_float32_and_migrated(tmp_path: Path):
+    import sqlite3
+
+    db = tmp_path / "legacy.db"
+    # a database written by the JSON-based schema
+    with sqlite3.connect(db) as conn:
+        conn.execute("CREATE TABLE embeddings (id INTEGER PRIMARY KEY, paper_id INTEGER, model TEXT, vector_json TEXT, chroma_id TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+        conn.execute("INSERT INTO embeddings (paper_id, model, vector_json) VALUES (1, 'm', '[0.5, 0.25]')")
+
+    await init_db(db)
+    await save_embedding(db, 1, "m", [1.0, 2.0])
+    embs = await get_embeddings_for_paper(db, 1)
+    assert [e["vector"].tolist() for e in embs] == [[0.5, 0.25], [1.0, 2.0]]
+    assert all(e["vector"].dtype == np.float32 for e in embs)
+
+    await save_embedding(db, 2, "m", [1.0, 0.5], fp16=True)
+    (half,) = await get_embeddings_for_paper(db, 2)
+    assert half["vector"].dtype == np.float16
+    assert half["vector"].tolist() == [1.0, 0.5]
+
+
+@pytest.mark.asyncio
+async def test_upsert_updates_in_place(tmp_path: Path):
+    db = tmp_path / "upsert.db"
+    await init_db(db)
+    pid = await upsert_paper(db, PaperMetadata(arxiv_id="2101.00014", title="Old"), pdf_path="p.pdf")
+    again = await upsert_paper(db, PaperMetadata(arxiv_id="2101.00014", title="New"), text_path="t.txt")
+    assert again == pid
+    rec = await get_paper_by_arxiv_id(db, "2101.00014")
+    assert (rec["title"], rec["pdf_path"], rec["text_path"]) == ("New", "p.pdf", "t.txt")
+
+
+@pytest.mark.asyncio
+async def test_upsert_papers_bulk(tmp_path: Path):
+    db = tmp_path / "bulk.db"
+    await init_db(db)
+    existing = await upsert_paper(db, PaperMetadata(arxiv_id="2101.00030", title="Old"), pdf_path="old.pdf")
+    metas = [PaperMetadata(arxiv_id=f"2101.0003{i}", title=f"Bulk {i}") for i in range(3)]
+    ids = await upsert_papers_bulk(db, [(m, None, f"t{i}.txt") for i, m in enumerate(metas)], "download", "pending")
+    assert ids[0] == existing
+    assert len(set(ids)) == 3
+    rec = await get_paper_by_arxiv_id(db, "2101.00030")
+    assert rec["title"] == "Bulk 0"
+    assert rec["pdf_path"] == "old.pdf"
+    assert rec["text_path"] == "t0.txt"
+    assert {p["id"] for p in await list_pending(db, stage="download")} == set(ids)
+    assert await upsert_papers_bulk(db, []) == []
+
+
+def test_transactions_from_several_threads(tmp_path: Path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from arxiv_agent.db import transaction
+
+    db = tmp_path / "threads.db"
+    asyncio.run(init_db(db))
+    pid = asyncio.run(upsert_paper(db, PaperMetadata(arxiv_id="2101.threads", title="Threads")))
+
+    async def write(i: int) -> None:
+        for _ in range(5):
+            async with transaction(db) as conn:
+                await conn.execute(INSERT_PROCESSING, (pid, "extract", "success", None))
+                await asyncio.sleep(0)
+
+    # each thread drives the one cached connection from its own event loop
+    with ThreadPoolExecutor(8) as pool:
+        for fut in [pool.submit(asyncio.run, write(i)) for i in range(8)]:
+            fut.result()
+
+    async def count() -> int:
+        async with (await get_conn(db)).execute("SELECT COUNT(*) FROM processing") as cur:
+            return (await cur.fetchone())[0]
+
+    assert asyncio.run(count()) == 40
+
+
+@pytest.mark.asyncio
+async def test_write_batcher_survives_failed_flush(tmp_path: Path, caplog):
+    db = tmp_path / "batch_fail.db"
+    await init_db(db)
+    pid = await upsert_paper(db, PaperMetadata(arxiv_id="2101.batchfail", title="Batch fail"))
+
+    async with WriteBatcher(db, max_rows=1) as batcher:
+        # no such table: this batch fails inside its transaction
+        batcher.submit("INSERT INTO missing (x) VALUES (?)", (1,))
+        await asyncio.sleep(0.05)
+        batcher.submit(INSERT_PROCESSING, (pid, "extract", "success", None))
+
+    async with (await get_conn(db)).execute("SELECT COUNT(*) FROM processing") as cur:
+        assert (await cur.fetchone())[0] == 1
+    assert "failed flush" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_init_db_pragmas(tmp_path: Path):
+    safe, fast = tmp_path / "safe.db", tmp_path / "fast.db"
+    await init_db(safe)
+    await init_db(fast, fast_unsafe=True)
+    conn = await get_conn(safe)
+    async with conn.execute("PRAGMA journal_mode") as cur:
+        assert (await cur.fetchone())[0] == "wal"
+    async with conn.execute("PRAGMA synchronous") as cur:
+        assert (await cur.fetchone())[0] == 1  # NORMAL
+    async with (await get_conn(fast)).execute("PRAGMA synchronous") as cur:
+        assert (await cur.fetchone())[0] == 0  # OFF
+    await init_db(fast, fast_unsafe=False)
+    async with (await get_conn(fast)).execute("PRAGMA synchronous") as cur:
+        assert (await cur.fetchone())[0] == 1  # NORMAL
+
+
+def test_fast_unsafe_survives_pipeline_calls(tmp_path: Path, monkeypatch):
+    from arxiv_agent.embeddings import embed_missing
+
+    db = tmp_path / "fast_kept.db"
+
+    async def synchronous() -> int:
+        async with (await get_conn(db)).execute("PRAGMA synchronous") as cur:
+            return (await cur.fetchone())[0]
+
+    asyncio.run(init_db(db, fast_unsafe=True))
+    asyncio.run(upsert_paper(db, PaperMetadata(arxiv_id="2101.fastkept", title="Fast"), text_path=str(tmp_path / "t.txt")))
+    # pipeline entry points call init_db() with the default, which must keep the mode
+    asyncio.run(init_db(db))
+    monkeypatch.setattr("arxiv_agent.embeddings._load_text", lambda path, max_chars=None: "cleaned text")
+    monkeypatch.setattr("arxiv_agent.embeddings.get_embeddings_batch", lambda texts, backend, model=None: [[0.1] for _ in texts])
+    assert len(embed_missing(db, backend="local", model="m")) == 1
+    assert asyncio.run(synchronous()) == 0  # OFF
+
+
+@pytest.mark.asyncio
+async def test_init_db_runs_schema_once_per_connection(tmp_path: Path, monkeypatch):
+    db = tmp_path / "once.db"
+    conn = await get_conn(db)
+    scripts = []
+    real = conn.executescript
+
+    async def counting_executescript(sql):
+        scripts.append(sql)
+        return await real(sql)
+
+    monkeypatch.setattr(conn, "executescript", counting_executescript)
+    await init_db(db)
+    await init_db(db)
+    assert len(scripts) == 1
+    assert await upsert_paper(db, PaperMetadata(arxiv_id="2101.00040", title="Once")) > 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_orjson", [True, False])
+async def test_json_columns_round_trip(tmp_path: Path, monkeypatch, use_orjson):
+    from arxiv_agent import db as db_mod
+
+    if not use_orjson:
+        monkeypatch.setattr(db_mod, "orjson", None)
+    elif db_mod.orjson is None:
+        pytest.skip("orjson not installed")
+    db = tmp_path / "json.db"
+    await init_db(db)
+    meta = PaperMetadata(arxiv_id="2101.00050", title="JSON", authors=["Ä", "B"], raw={"entry_id": "x", "n": [1, 2]})
+    await upsert_paper(db, meta)
+    rec = await get_paper_by_arxiv_id(db, "2101.00050")
+    assert rec["authors"] == ["Ä", "B"]
+    assert rec["raw"] == {"entry_id": "x", "n": [1, 2]}
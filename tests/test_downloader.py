@@ -1,11 +1,18 @@
 import pytest
 
+import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from arxiv_agent.downloader import download_pdf
+import httpx
+
+from arxiv_agent.downloader import DownloadError, download_pdf
 
 
 class FakeResponse:
+    status_code = 200
+    headers: dict = {}
+
     def __init__(self, data: bytes):
         self._data = data
 
@@ -23,8 +30,9 @@ class DummyClient:
     def __init__(self, data: bytes):
         self._data = data
 
-    async def get(self, url, follow_redirects=True):
-        return FakeResponse(self._data)
+    @asynccontextmanager
+    async def stream(self, method, url, follow_redirects=True):
+        yield FakeResponse(self._data)
 
     async def aclose(self):
         return None
@@ -49,11 +57,12 @@ async def test_download_pdf_retries(tmp_path: Path):
             self._data = data
             self.calls = 0
 
-        async def get(self, url, follow_redirects=True):
+        @asynccontextmanager
+        async def stream(self, method, url, follow_redirects=True):
             self.calls += 1
             if self.calls == 1:
-                raise Exception("transient network error")
-            return FakeResponse(self._data)
+                raise httpx.ConnectError("transient network error")
+            yield FakeResponse(self._data)
 
         async def aclose(self):
             return None
@@ -66,3 +75,161 @@ async def test_download_pdf_retries(tmp_path: Path):
     assert result.exists()
     assert dest.read_bytes() == data
     assert client.calls >= 2
+
+
+@pytest.mark.asyncio
+async def test_download_pdf_rejects_non_pdf(tmp_path: Path):
+    dest = tmp_path / "error.pdf"
+    client = DummyClient(b"<html>rate limited</html>")
+
+    with pytest.raises(DownloadError, match="not a PDF"):
+        await download_pdf("http://example.com/error.pdf", dest, client=client)
+    assert not dest.exists()
+
+
+@pytest.mark.asyncio
+async def test_download_pdf_does_not_retry_404(tmp_path: Path):
+    class NotFoundClient:
+        def __init__(self):
+            self.calls = 0
+
+        @asynccontextmanager
+        async def stream(self, method, url, follow_redirects=True):
+            self.calls += 1
+            yield httpx.Response(404, request=httpx.Request(method, url))
+
+    client = NotFoundClient()
+    with pytest.raises(DownloadError):
+        await download_pdf("http://example.com/missing.pdf", tmp_path / "missing.pdf", client=client)
+    assert client.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_download_pdf_many_chunks(tmp_path: Path):
+    class ChunkedResponse(FakeResponse):
+        async def aiter_bytes(self, chunk_size: int = 8192):
+            for i in range(0, len(self._data), 7):
+                yield self._data[i : i + 7]
+
+    class ChunkedClient(DummyClient):
+        @asynccontextmanager
+        async def stream(self, method, url, follow_redirects=True):
+            yield ChunkedResponse(self._data)
+
+    data = b"%PDF-1.4 " + bytes(range(256)) * 40
+    dest = tmp_path / "big.pdf"
+    await download_pdf("http://example.com/big.pdf", dest, client=ChunkedClient(data))
+    assert dest.read_bytes() == data
+
+
+def test_write_all_handles_short_writes(tmp_path: Path, monkeypatch):
+    from arxiv_agent import downloader
+
+    real_writev = downloader.os.writev
+    calls = []
+
+    def short_writev(fd, buffers):
+        # the kernel may accept fewer bytes than requested
+        calls.append(len(buffers))
+        return real_writev(fd, [bytes(buffers[0][:3])])
+
+    monkeypatch.setattr(downloader.os, "writev", short_writev)
+    monkeypatch.setattr(downloader, "_HAVE_WRITEV", True)
+    path = tmp_path / "out.bin"
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+    try:
+        downloader._write_all(fd, [b"%PDF-", b"", b"abcdefg", b"xyz"])
+    finally:
+        os.close(fd)
+    assert path.read_bytes() == b"%PDF-abcdefgxyz"
+    assert calls[0] == 3
+
+
+@pytest.mark.asyncio
+async def test_download_pdf_resumes_partial_file(tmp_path: Path):
+    from arxiv_agent.downloader import digest_path, file_digest, is_intact
+
+    data = b"%PDF-1.4 " + bytes(range(256)) * 8
+    cut = 300
+
+    class ResumingResponse(FakeResponse):
+        def __init__(self, data: bytes, status_code: int = 200, headers=None, fail_after=None):
+            super().__init__(data)
+            self.status_code = status_code
+            self.headers = headers or {}
+            self._fail_after = fail_after
+
+        async def aiter_bytes(self, chunk_size: int = 8192):
+            if self._fail_after is None:
+                yield self._data
+                return
+            yield self._data[: self._fail_after]
+            raise httpx.ReadError("connection dropped")
+
+    class ResumingClient:
+        def __init__(self):
+            self.ranges = []
+
+        @asynccontextmanager
+        async def stream(self, method, url, follow_redirects=True, headers=None):
+            rng = (headers or {}).get("Range")
+            self.ranges.append((rng, (headers or {}).get("If-Range")))
+            if rng is None:
+                yield ResumingResponse(data, headers={"ETag": '"v1"'}, fail_after=cut)
+            else:
+                start = int(rng.split("=")[1].rstrip("-"))
+                yield ResumingResponse(data[start:], 206, {"Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}"})
+
+    dest = tmp_path / "resume.pdf"
+    client = ResumingClient()
+    await download_pdf("http://example.com/resume.pdf", dest, client=client)
+    assert dest.read_bytes() == data
+    assert client.ranges == [(None, None), (f"bytes={cut}-", '"v1"')]
+    assert not (tmp_path / "resume.pdf.part.validator").exists()
+    # the digest covers the bytes from both attempts
+    assert digest_path(dest).read_text() == file_digest(dest)
+    assert is_intact(dest)
+    dest.write_bytes(data[:-1])
+    assert not is_intact(dest)
+
+
+@pytest.mark.asyncio
+async def test_download_pdf_restarts_when_file_changed(tmp_path: Path):
+    old = b"%PDF-1.4 old version " * 20
+    new = b"%PDF-1.5 new version " * 30
+    dest = tmp_path / "changed.pdf"
+    # left over from an earlier run that fetched the old version
+    (tmp_path / "changed.pdf.part").write_bytes(old[:100])
+    (tmp_path / "changed.pdf.part.validator").write_text('"v1"')
+
+    class ChangedResponse(FakeResponse):
+        # If-Range no longer matches, so the server sends the whole new file
+        headers = {"ETag": '"v2"'}
+
+        async def aiter_bytes(self, chunk_size: int = 8192):
+            yield self._data
+
+    class ChangedClient:
+        def __init__(self):
+            self.headers = []
+
+        @asynccontextmanager
+        async def stream(self, method, url, follow_redirects=True, headers=None):
+            self.headers.append(headers)
+            yield ChangedResponse(new)
+
+    client = ChangedClient()
+    await download_pdf("http://example.com/changed.pdf", dest, client=client)
+    assert client.headers == [{"Range": "bytes=100-", "If-Range": '"v1"'}]
+    assert dest.read_bytes() == new
+
+
+@pytest.mark.asyncio
+async def test_download_pdf_does_not_resume_without_validator(tmp_path: Path):
+    data = b"%PDF-1.4 " + b"x" * 500
+    dest = tmp_path / "novalidator.pdf"
+    (tmp_path / "novalidator.pdf.part").write_bytes(data[:100])
+
+    client = DummyClient(data)
+    await download_pdf("http://example.com/novalidator.pdf", dest, client=client)
+    assert dest.read_bytes() == data
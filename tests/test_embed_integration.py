@@ -1,29 +1,26 @@
-import asyncio
 from pathlib import Path
 
 import pytest
 
 from arxiv_agent import embeddings as emb_mod
-from arxiv_agent.db import init_db, upsert_paper, get_embeddings_for_paper
+from arxiv_agent.db import init_db, upsert_papers_bulk, get_embeddings_for_paper
 from arxiv_agent.models import PaperMetadata
 
 
-def test_embed_missing_batched(tmp_path: Path, monkeypatch):
+def test_embed_missing_batched(tmp_path: Path, monkeypatch, loop):
     db = tmp_path / "embed_int.db"
     # initialize DB
-    asyncio.run(init_db(db))
+    loop.run_until_complete(init_db(db))
 
-    pids = []
     # create a few papers to embed
+    papers = [(PaperMetadata(arxiv_id=f"2101.int{i}", title=f"Title {i}"), None, str(tmp_path / f"t{i}.txt")) for i in range(3)]
+    pids = loop.run_until_complete(upsert_papers_bulk(db, papers))
     for i in range(3):
-        meta = PaperMetadata(arxiv_id=f"2101.int{i}", title=f"Title {i}")
-        pid = asyncio.run(upsert_paper(db, meta, text_path=str(tmp_path / f"t{i}.txt")))
-        pids.append(pid)
         (tmp_path / f"t{i}.txt").write_text(f"Text {i}", encoding="utf-8")
 
     # monkeypatch embedding and text loader to avoid external deps
-    monkeypatch.setattr("arxiv_agent.embeddings.get_embedding", lambda text, backend, model=None: [0.1, 0.2, 0.3])
-    monkeypatch.setattr("arxiv_agent.embeddings._load_text", lambda path: "cleaned text")
+    monkeypatch.setattr("arxiv_agent.embeddings.get_embeddings_batch", lambda texts, backend, model=None: [[0.1, 0.2, 0.3] for _ in texts])
+    monkeypatch.setattr("arxiv_agent.embeddings._load_text", lambda path, max_chars=None: "cleaned text")
 
     # run embed_missing in batches of 1 (exercise batching code path)
     res = emb_mod.embed_missing(db, backend="local", model="m", chroma_dir=None, limit=None, batch_size=1, delay=0)
@@ -32,5 +29,32 @@ def test_embed_missing_batched(tmp_path: Path, monkeypatch):
 
     # ensure embeddings were saved in DB
     for pid in pids:
-        embs = asyncio.run(get_embeddings_for_paper(db, pid))
+        embs = loop.run_until_complete(get_embeddings_for_paper(db, pid))
         assert len(embs) == 1
+
+
+def test_embed_missing_migrates_legacy_db(tmp_path: Path, monkeypatch):
+    import sqlite3
+
+    db = tmp_path / "legacy.db"
+    text = tmp_path / "old.txt"
+    text.write_text("Old text", encoding="utf-8")
+    # a database ingested before embeddings were stored as BLOBs
+    with sqlite3.connect(db) as conn:
+        conn.executescript(
+            """
+            CREATE TABLE papers (id INTEGER PRIMARY KEY, arxiv_id TEXT UNIQUE, title TEXT, authors TEXT, summary TEXT,
+                published TIMESTAMP, pdf_path TEXT, text_path TEXT, raw_json TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE processing (id INTEGER PRIMARY KEY, paper_id INTEGER, stage TEXT, status TEXT, error TEXT,
+                tried_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE embeddings (id INTEGER PRIMARY KEY, paper_id INTEGER, model TEXT, vector_json TEXT, chroma_id TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            """
+        )
+        conn.execute("INSERT INTO papers (arxiv_id, title, text_path) VALUES ('2101.old', 'Old', ?)", (str(text),))
+
+    monkeypatch.setattr("arxiv_agent.embeddings.get_embeddings_batch", lambda texts, backend, model=None: [[0.1, 0.2] for _ in texts])
+    res = emb_mod.embed_missing(db, backend="local", model="m", chroma_dir=None)
+    assert len(res) == 1
+    assert res[0]["embedding_id"] is not None
@@ -1,10 +1,11 @@
 import asyncio
 from pathlib import Path
 
+import numpy as np
 import pytest
 
-from arxiv_agent.embeddings import embed_paper, embed_missing
-from arxiv_agent.db import init_db, upsert_paper, get_paper_by_arxiv_id, get_embeddings_for_paper
+from arxiv_agent.embeddings import MAX_TEXT_CHARS, embed_paper, embed_missing
+from arxiv_agent.db import init_db, upsert_paper, upsert_papers_bulk, get_paper_by_arxiv_id, get_embeddings_for_paper
 from arxiv_agent.models import PaperMetadata
 
 
@@ -32,9 +33,274 @@ def test_embed_missing_monkeypatched(tmp_path: Path, monkeypatch):
     pid = asyncio.run(upsert_paper(db, meta, text_path=str(tmp_path / "t2.txt")))
     (tmp_path / "t2.txt").write_text("Text for embed", encoding="utf-8")
 
-    monkeypatch.setattr("arxiv_agent.embeddings._load_text", lambda path: "cleaned text")
-    monkeypatch.setattr("arxiv_agent.embeddings.get_embedding", lambda text, backend, model=None: [0.4, 0.5])
+    monkeypatch.setattr("arxiv_agent.embeddings._load_text", lambda path, max_chars=None: "cleaned text")
+    monkeypatch.setattr("arxiv_agent.embeddings.get_embeddings_batch", lambda texts, backend, model=None: [[0.4, 0.5] for _ in texts])
 
     res = embed_missing(db, backend="local", model="m", chroma_dir=None)
     assert isinstance(res, list)
     assert len(res) >= 1
+
+
+def test_embed_missing_single_request_per_batch(tmp_path: Path, monkeypatch):
+    db = tmp_path / "embed3.db"
+    asyncio.run(init_db(db))
+    for i in range(3):
+        asyncio.run(upsert_paper(db, PaperMetadata(arxiv_id=f"2101.batch{i}", title=f"Batch {i}"), text_path=str(tmp_path / f"b{i}.txt")))
+
+    calls = []
+
+    def fake_batch(texts, backend, model=None):
+        calls.append(len(texts))
+        return [[0.1, 0.2] for _ in texts]
+
+    monkeypatch.setattr("arxiv_agent.embeddings._load_text", lambda path, max_chars=None: "cleaned text")
+    monkeypatch.setattr("arxiv_agent.embeddings.get_embeddings_batch", fake_batch)
+
+    res = embed_missing(db, backend="local", model="m", chroma_dir=None)
+    assert calls == [3]
+    assert len({r["embedding_id"] for r in res}) == 3
+
+
+def test_embed_missing_concurrent_batches_keep_order(tmp_path: Path, monkeypatch):
+    db = tmp_path / "embed4.db"
+    asyncio.run(init_db(db))
+    pids = [
+        asyncio.run(upsert_paper(db, PaperMetadata(arxiv_id=f"2101.conc{i}", title=f"Conc {i}"), text_path=str(tmp_path / f"c{i}.txt")))
+        for i in range(4)
+    ]
+
+    monkeypatch.setattr("arxiv_agent.embeddings._load_text", lambda path, max_chars=None: "cleaned text")
+    monkeypatch.setattr("arxiv_agent.embeddings.get_embeddings_batch", lambda texts, backend, model=None: [[0.1, 0.2] for _ in texts])
+
+    res = embed_missing(db, backend="local", model="m", chroma_dir=None, batch_size=1, concurrency=3)
+    assert [r["paper_id"] for r in res] == pids
+    assert len({r["embedding_id"] for r in res}) == 4
+
+
+def test_embed_missing_adds_batch_to_chroma_once(tmp_path: Path, monkeypatch):
+    db = tmp_path / "embed5.db"
+    asyncio.run(init_db(db))
+    for i in range(3):
+        asyncio.run(upsert_paper(db, PaperMetadata(arxiv_id=f"2101.chroma{i}", title=f"Chroma {i}"), text_path=str(tmp_path / f"h{i}.txt")))
+
+    adds = []
+
+    class FakeCollection:
+        def add(self, ids, embeddings, metadatas, documents):
+            adds.append((ids, embeddings))
+
+    class FakeClient:
+        def get_or_create_collection(self, name):
+            return FakeCollection()
+
+    monkeypatch.setattr("arxiv_agent.embeddings._get_chroma_client", lambda persist_directory=None: FakeClient())
+    monkeypatch.setattr("arxiv_agent.embeddings._load_text", lambda path, max_chars=None: "cleaned text")
+    monkeypatch.setattr("arxiv_agent.embeddings.get_embeddings_batch", lambda texts, backend, model=None: [[0.1, 0.2] for _ in texts])
+
+    res = embed_missing(db, backend="local", model="m", chroma_dir=str(tmp_path / "chroma"))
+    assert len(adds) == 1
+    ids, embeddings = adds[0]
+    assert ids == [r["chroma_id"] for r in res]
+    # chromadb 0.4 only accepts plain lists of floats
+    assert all(type(e) is list and type(e[0]) is float for e in embeddings)
+    assert np.allclose(embeddings, [[0.1, 0.2]] * 3)
+
+
+def test_load_text_reads_prefix(tmp_path: Path):
+    from arxiv_agent.embeddings import _load_text
+
+    p = tmp_path / "long.txt"
+    p.write_text("ab" * 100, encoding="utf-8")
+    assert _load_text(p, max_chars=5) == "ababa"
+    assert len(_load_text(p, max_chars=None)) == 200
+    assert _load_text(tmp_path / "missing.txt") == ""
+
+
+def test_load_text_cached_until_file_changes(tmp_path: Path):
+    import os
+
+    from arxiv_agent import embeddings
+
+    p = tmp_path / "paper.txt"
+    p.write_text("first  version", encoding="utf-8")
+    embeddings._read_clean_text.cache_clear()
+    assert embeddings._load_text(p) == "first version"
+    assert embeddings._load_text(p) == "first version"
+    assert embeddings._read_clean_text.cache_info().hits == 1
+
+    p.write_text("second version", encoding="utf-8")
+    st = p.stat()
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert embeddings._load_text(p) == "second version"
+    embeddings._read_clean_text.cache_clear()
+
+
+def test_embed_paper_sync_reuses_loop(tmp_path: Path, monkeypatch):
+    from arxiv_agent import embeddings
+
+    db = tmp_path / "sync.db"
+    loops = []
+
+    async def fake_embed_paper(*args, **kwargs):
+        loops.append(asyncio.get_running_loop())
+        return {"embedding_id": len(loops), "chroma_id": None}
+
+    monkeypatch.setattr(embeddings, "embed_paper", fake_embed_paper)
+    assert embeddings.embed_paper_sync(db, 1, "a", tmp_path / "a.txt")["embedding_id"] == 1
+    assert embeddings.embed_paper_sync(db, 2, "b", tmp_path / "b.txt")["embedding_id"] == 2
+    assert loops[0] is loops[1]
+
+    async def inside_loop():
+        embeddings.embed_paper_sync(db, 3, "c", tmp_path / "c.txt")
+
+    with pytest.raises(RuntimeError, match="running event loop"):
+        asyncio.run(inside_loop())
+
+
+def test_embed_missing_local_batches_similar_lengths(tmp_path: Path, monkeypatch):
+    db = tmp_path / "embed_len.db"
+    asyncio.run(init_db(db))
+    lengths = [300, 10, 200, 20]
+    pids = []
+    for i, n in enumerate(lengths):
+        (tmp_path / f"l{i}.txt").write_text("abcd"[i] * n, encoding="utf-8")
+        pids.append(asyncio.run(upsert_paper(db, PaperMetadata(arxiv_id=f"2101.len{i}", title=f"Len {i}"), text_path=str(tmp_path / f"l{i}.txt"))))
+
+    batches = []
+
+    def fake_batch(texts, backend, model=None):
+        batches.append([(t[0], len(t)) for t in texts])
+        return [[float(len(t))] for t in texts]
+
+    # only the first 100 characters are read: the two longer files embed alike and keep DB order
+    monkeypatch.setitem(MAX_TEXT_CHARS, "local", 100)
+    monkeypatch.setattr("arxiv_agent.embeddings.get_embeddings_batch", fake_batch)
+    res = embed_missing(db, backend="local", model="m", chroma_dir=None, batch_size=2)
+    assert batches == [[("b", 10), ("d", 20)], [("a", 100), ("c", 100)]]
+    # results come back in the original (DB) order
+    assert [r["paper_id"] for r in res] == pids
+
+
+def test_embed_missing_loads_texts_off_the_event_loop(tmp_path: Path, monkeypatch):
+    import threading
+
+    db = tmp_path / "embed_thread.db"
+    asyncio.run(init_db(db))
+    asyncio.run(upsert_paper(db, PaperMetadata(arxiv_id="2101.thread", title="Thread"), text_path=str(tmp_path / "x.txt")))
+
+    threads = []
+
+    def fake_load_text(path, max_chars=None):
+        threads.append(threading.get_ident())
+        return "cleaned text"
+
+    monkeypatch.setattr("arxiv_agent.embeddings._load_text", fake_load_text)
+    monkeypatch.setattr("arxiv_agent.embeddings.get_embeddings_batch", lambda texts, backend, model=None: [[0.1] for _ in texts])
+    assert len(embed_missing(db, backend="local", model="m", chroma_dir=None)) == 1
+    assert threads and threads[0] != threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_load_texts_async_runs_under_cpu_limiter(tmp_path: Path, monkeypatch):
+    import os
+
+    import anyio
+
+    from arxiv_agent import embeddings
+
+    (tmp_path / "lim.txt").write_text("limited  text", encoding="utf-8")
+    calls = []
+    run_sync = anyio.to_thread.run_sync
+
+    async def spy(func, *args, limiter=None):
+        calls.append((func, limiter))
+        return await run_sync(func, *args, limiter=limiter)
+
+    monkeypatch.setattr(anyio.to_thread, "run_sync", spy)
+    assert await embeddings._load_texts_async([tmp_path / "lim.txt"], None) == ["limited text"]
+    limiter = embeddings._cpu_limiter()
+    assert calls == [(embeddings._load_texts, limiter)]
+    assert limiter.total_tokens == (os.cpu_count() or 1)
+
+
+def test_embed_paper_sync_from_several_threads(tmp_path: Path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from arxiv_agent import embeddings
+
+    db = tmp_path / "threads.db"
+    asyncio.run(init_db(db))
+    papers = [(PaperMetadata(arxiv_id=f"2101.thr{i}", title=f"Thread {i}"), None, str(tmp_path / f"thr{i}.txt")) for i in range(40)]
+    pids = asyncio.run(upsert_papers_bulk(db, papers))
+    for i in range(40):
+        (tmp_path / f"thr{i}.txt").write_text(f"Text {i}", encoding="utf-8")
+
+    # only the backend is stubbed: every call goes through init_db and the shared connection
+    monkeypatch.setattr(embeddings, "get_embedding", lambda text, backend, model=None: [0.1, 0.2])
+    with ThreadPoolExecutor(8) as pool:
+        futs = [
+            pool.submit(embeddings.embed_paper_sync, db, pid, f"2101.thr{i}", tmp_path / f"thr{i}.txt", backend="local", model="m")
+            for i, pid in enumerate(pids)
+        ]
+        emb_ids = [f.result()["embedding_id"] for f in futs]
+    assert len(set(emb_ids)) == 40
+
+    async def stored() -> list:
+        return [len(await get_embeddings_for_paper(db, pid)) for pid in pids]
+
+    assert asyncio.run(stored()) == [1] * 40
+
+
+def test_embed_missing_skips_papers_without_text(tmp_path: Path, monkeypatch):
+    db = tmp_path / "embed_empty.db"
+    asyncio.run(init_db(db))
+    for i in range(3):
+        asyncio.run(upsert_paper(db, PaperMetadata(arxiv_id=f"2101.empty{i}", title=f"Empty {i}"), text_path=str(tmp_path / f"e{i}.txt")))
+
+    sent = []
+
+    def fake_batch(texts, backend, model=None, token_counts=None):
+        sent.extend(texts)
+        return [[0.1, 0.2] for _ in texts]
+
+    # the middle paper's text file is missing, so it loads as ""
+    monkeypatch.setattr("arxiv_agent.embeddings._load_text", lambda path, max_chars=None: "" if path.endswith("e1.txt") else "cleaned text")
+    monkeypatch.setattr("arxiv_agent.embeddings.get_embeddings_batch", fake_batch)
+
+    res = embed_missing(db, backend="openai", model="m", chroma_dir=None)
+    assert sent == ["cleaned text", "cleaned text"]
+    assert [r["embedding_id"] is None for r in res] == [False, True, False]
+    assert res[1]["error"]
+
+
+def test_embed_missing_tokenizes_openai_texts_once(tmp_path: Path, monkeypatch):
+    import types
+
+    from arxiv_agent import nlp
+
+    db = tmp_path / "embed_tok.db"
+    asyncio.run(init_db(db))
+    for i in range(3):
+        asyncio.run(upsert_paper(db, PaperMetadata(arxiv_id=f"2101.tok{i}", title=f"Tok {i}"), text_path=str(tmp_path / f"k{i}.txt")))
+
+    encoded = []
+
+    class FakeEncoding:
+        def encode(self, text, disallowed_special=()):
+            encoded.append(text)
+            return list(text)
+
+        def decode(self, tokens):
+            return "".join(tokens)
+
+    class FakeEmbeddings:
+        def create(self, input, model):
+            return types.SimpleNamespace(data=[types.SimpleNamespace(index=i, embedding=[0.1]) for i in range(len(input))])
+
+    monkeypatch.setattr(nlp, "_token_encoding", lambda model: FakeEncoding())
+    monkeypatch.setattr(nlp, "_openai", lambda: types.SimpleNamespace(embeddings=FakeEmbeddings()))
+    monkeypatch.setattr("arxiv_agent.embeddings._load_text", lambda path, max_chars=None: "cleaned text")
+
+    res = embed_missing(db, backend="openai", model="m", chroma_dir=None, rpm=1000)
+    assert all(r["embedding_id"] for r in res)
+    assert len(encoded) == 3
@@ -0,0 +1,67 @@
+import httpx
+import pytest
+
+from arxiv_agent.http import borrow_client
+
+
+@pytest.mark.asyncio
+async def test_borrow_client_never_closes_a_client():
+    async with httpx.AsyncClient() as mine:
+        async with borrow_client(mine) as c:
+            assert c is mine
+        assert not mine.is_closed
+
+
+def test_shared_client_reused_per_loop_and_closed_with_it():
+    import asyncio
+
+    async def borrow_twice():
+        async with borrow_client() as first:
+            pass
+        async with borrow_client() as second:
+            assert not second.is_closed
+        return first, second
+
+    first, second = asyncio.run(borrow_twice())
+    assert first is second
+    # asyncio.run shut the loop down, closing its client
+    assert first.is_closed
+    other, _ = asyncio.run(borrow_twice())
+    assert other is not first
+
+    # the sync wrappers' per-thread Runner closes it the same way
+    with asyncio.Runner() as runner:
+        kept, _ = runner.run(borrow_twice())
+        assert runner.run(borrow_twice())[0] is kept
+    assert kept.is_closed
+
+
+def test_sync_wrappers_share_one_client(tmp_path, monkeypatch):
+    import arxiv_agent
+    from arxiv_agent import downloader
+
+    seen = []
+
+    async def fake_fetch(url, dest, client):
+        seen.append(client)
+        return dest
+
+    monkeypatch.setattr(downloader, "_fetch", fake_fetch)
+    arxiv_agent.download_pdf_sync("http://example.com/a.pdf", tmp_path / "a.pdf")
+    arxiv_agent.download_pdf_sync("http://example.com/b.pdf", tmp_path / "b.pdf")
+    assert seen[0] is seen[1] and not seen[0].is_closed
+
+
+@pytest.mark.asyncio
+async def test_ingest_closes_its_client(tmp_path, monkeypatch):
+    import arxiv_agent.ingest as ingest
+
+    seen = []
+
+    async def fake_search_arxiv(query, max_results=10, client=None):
+        seen.append(client)
+        return []
+
+    monkeypatch.setattr(ingest, "search_arxiv", fake_search_arxiv)
+    await ingest.ingest_query("q", max_results=1, output_dir=tmp_path)
+    assert seen[0] is not None and seen[0].is_closed
@@ -11,7 +11,7 @@ async def test_ingest_query_monkeypatched(tmp_path: Path, monkeypatch):
     # Prepare a fake PaperMetadata list
     meta = PaperMetadata(arxiv_id="2101.00001", title="Test Paper", pdf_url="http://example.com/test.pdf")
 
-    async def fake_search_arxiv(query, max_results=10):
+    async def fake_search_arxiv(query, max_results=10, client=None):
         return [meta]
 
     async def fake_download_pdf(url, dest, client=None):
@@ -38,12 +38,13 @@ async def test_ingest_query_monkeypatched(tmp_path: Path, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_ingest_duplicates(tmp_path: Path, monkeypatch):
+@pytest.mark.parametrize("concurrency", [1, 4])
+async def test_ingest_duplicates(tmp_path: Path, monkeypatch, concurrency):
     # Two entries with same arxiv_id should be deduplicated
     meta1 = PaperMetadata(arxiv_id="2101.00001", title="Paper A", pdf_url="http://example.com/a.pdf")
     meta2 = PaperMetadata(arxiv_id="2101.00001", title="Paper A duplicate", pdf_url="http://example.com/a_dup.pdf")
 
-    async def fake_search_arxiv(query, max_results=10):
+    async def fake_search_arxiv(query, max_results=10, client=None):
         return [meta1, meta2]
 
     download_calls = {"count": 0}
@@ -63,8 +64,8 @@ async def test_ingest_duplicates(tmp_path: Path, monkeypatch):
     monkeypatch.setattr(ingest, "download_pdf", fake_download_pdf)
     monkeypatch.setattr(ingest, "extract_text", fake_extract_text)
 
-    results = await ingest.ingest_query("test query", max_results=2, output_dir=tmp_path, concurrency=1)
-    # Should deduplicate and only download once
+    results = await ingest.ingest_query("test query", max_results=2, output_dir=tmp_path, concurrency=concurrency)
+    # Should deduplicate before scheduling, so even parallel workers only download once
     assert download_calls["count"] == 1
     assert len(results) == 1
 
@@ -75,7 +76,7 @@ async def test_ingest_error_handling(tmp_path: Path, monkeypatch):
     meta_ok = PaperMetadata(arxiv_id="2101.00002", title="OK Paper", pdf_url="http://example.com/ok.pdf")
     meta_fail = PaperMetadata(arxiv_id="2101.00003", title="Bad Paper", pdf_url="http://example.com/bad.pdf")
 
-    async def fake_search_arxiv(query, max_results=10):
+    async def fake_search_arxiv(query, max_results=10, client=None):
         return [meta_ok, meta_fail]
 
     async def fake_download_pdf(url, dest, client=None):
@@ -100,3 +101,213 @@ async def test_ingest_error_handling(tmp_path: Path, monkeypatch):
     assert statuses["2101.00002"]["success"] is True
     assert statuses["2101.00003"]["success"] is False
     assert "download error" in statuses["2101.00003"]["error"]
+
+
+@pytest.mark.asyncio
+async def test_extract_text(tmp_path: Path):
+    import fitz
+
+    from arxiv_agent.ingest import extract_text
+
+    pdf_path = tmp_path / "doc.pdf"
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Hello arXiv")
+    doc.save(str(pdf_path))
+    doc.close()
+
+    text = await extract_text(pdf_path)
+    assert "Hello arXiv" in text
+
+
+def test_dedupe_metas_versions_and_titles():
+    from arxiv_agent.ingest import dedupe_metas
+
+    v1 = PaperMetadata(arxiv_id="2101.00001v1", title="A Paper")
+    v2 = PaperMetadata(arxiv_id="2101.00001v2", title="A Paper", summary="Abstract")
+    retitled = PaperMetadata(arxiv_id="2101.00009", title="a  paper!")
+    other = PaperMetadata(arxiv_id="2101.00002", title="Another Paper")
+
+    unique = dedupe_metas([v1, v2, retitled, other])
+    assert unique == [v2, other]
+
+
+@pytest.mark.asyncio
+async def test_ingest_reuses_existing_files(tmp_path: Path, monkeypatch):
+    meta = PaperMetadata(arxiv_id="2101.00004", title="Cached Paper", pdf_url="http://example.com/c.pdf")
+
+    async def fake_search_arxiv(query, max_results=10, client=None):
+        return [meta]
+
+    calls = {"download": 0, "extract": 0}
+
+    async def fake_download_pdf(url, dest, client=None):
+        calls["download"] += 1
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(b"%PDF-1.4 FAKEPDF")
+        return dest
+
+    async def fake_extract_text(pdf_path: Path):
+        calls["extract"] += 1
+        return "Extracted text"
+
+    import arxiv_agent.ingest as ingest
+
+    monkeypatch.setattr(ingest, "search_arxiv", fake_search_arxiv)
+    monkeypatch.setattr(ingest, "download_pdf", fake_download_pdf)
+    monkeypatch.setattr(ingest, "extract_text", fake_extract_text)
+
+    await ingest.ingest_query("q", max_results=1, output_dir=tmp_path, concurrency=1)
+    results = await ingest.ingest_query("q", max_results=1, output_dir=tmp_path, concurrency=1)
+    assert results[0]["success"] is True
+    assert calls == {"download": 1, "extract": 1}
+
+    await ingest.ingest_query("q", max_results=1, output_dir=tmp_path, concurrency=1, force=True)
+    assert calls == {"download": 2, "extract": 2}
+
+
+def test_extract_arxiv_id_strips_version():
+    from arxiv_agent.ingest import _extract_arxiv_id
+
+    assert _extract_arxiv_id("http://arxiv.org/abs/2101.00001v2") == "2101.00001"
+    assert _extract_arxiv_id("https://arxiv.org/pdf/2101.00001v1.pdf") == "2101.00001"
+    assert _extract_arxiv_id("https://arxiv.org/abs/2101.00001") == "2101.00001"
+    assert _extract_arxiv_id("2101.00001v3") == "2101.00001"
+    assert _extract_arxiv_id("") == ""
+
+
+ATOM_FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:arxiv="http://arxiv.org/schemas/atom">
+  <entry>
+    <id>http://arxiv.org/abs/2101.00001v2</id>
+    <published>2021-01-01T00:00:00Z</published>
+    <title>A Wrapped
+      Title</title>
+    <summary>  Some abstract.
+    </summary>
+    <author><name>Ada Lovelace</name></author>
+    <author><name>Alan Turing</name></author>
+    <link href="http://arxiv.org/abs/2101.00001v2" rel="alternate" type="text/html"/>
+    <link title="pdf" href="http://arxiv.org/pdf/2101.00001v2" rel="related" type="application/pdf"/>
+  </entry>
+</feed>
+"""
+
+
+@pytest.mark.asyncio
+async def test_search_arxiv_parses_atom():
+    import httpx
+
+    from arxiv_agent.ingest import search_arxiv
+
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen["params"] = dict(request.url.params)
+        return httpx.Response(200, content=ATOM_FEED)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        metas = await search_arxiv("all:test", max_results=5, client=client)
+
+    assert seen["params"] == {"search_query": "all:test", "max_results": "5"}
+    assert len(metas) == 1
+    m = metas[0]
+    assert m.arxiv_id == "2101.00001"
+    assert m.title == "A Wrapped Title"
+    assert m.summary == "Some abstract."
+    assert m.authors == ["Ada Lovelace", "Alan Turing"]
+    assert m.published.year == 2021
+    assert m.pdf_url == "http://arxiv.org/pdf/2101.00001v2"
+
+
+@pytest.mark.asyncio
+async def test_extract_text_replaces_broken_pool(monkeypatch):
+    from concurrent.futures import Future
+    from concurrent.futures.process import BrokenProcessPool
+
+    import arxiv_agent.ingest as ingest
+
+    class BrokenPool:
+        def submit(self, fn, *args):
+            fut = Future()
+            fut.set_exception(BrokenProcessPool("worker died"))
+            return fut
+
+        def shutdown(self, wait=True):
+            pass
+
+    broken = BrokenPool()
+    monkeypatch.setattr(ingest, "_PDF_POOL", broken)
+    monkeypatch.setattr(ingest, "_PDF_IN_THREADS", False)
+    with pytest.raises(BrokenProcessPool):
+        await ingest.extract_text(Path("missing.pdf"))
+    # fresh workers do start, so the crash was this file's; later files use a new pool
+    assert ingest._PDF_POOL is not broken
+    assert not ingest._PDF_IN_THREADS
+
+
+@pytest.mark.asyncio
+async def test_extract_text_falls_back_to_threads(tmp_path: Path, monkeypatch):
+    from concurrent.futures import Future
+    from concurrent.futures.process import BrokenProcessPool
+
+    import fitz
+
+    import arxiv_agent.ingest as ingest
+
+    class UnstartablePool:
+        # what a pool looks like when its workers die while importing __main__
+        def submit(self, fn, *args):
+            fut = Future()
+            fut.set_exception(BrokenProcessPool("worker died"))
+            return fut
+
+        def shutdown(self, wait=True):
+            pass
+
+    pdf_path = tmp_path / "threads.pdf"
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "parsed in a thread")
+    doc.save(pdf_path)
+
+    monkeypatch.setattr(ingest, "_PDF_POOL", None)
+    monkeypatch.setattr(ingest, "_PDF_IN_THREADS", False)
+    monkeypatch.setattr(ingest, "_pdf_pool", UnstartablePool)
+    assert "parsed in a thread" in await ingest.extract_text(pdf_path)
+    assert ingest._PDF_IN_THREADS
+    assert "parsed in a thread" in await ingest.extract_text(pdf_path)
+
+
+@pytest.mark.asyncio
+async def test_ingest_skips_papers_already_in_db(tmp_path: Path, monkeypatch):
+    meta = PaperMetadata(arxiv_id="2101.00007", title="Known Paper", pdf_url="http://example.com/k.pdf")
+    calls = {"download": 0, "extract": 0}
+
+    async def fake_search_arxiv(query, max_results=10, client=None):
+        return [meta]
+
+    async def fake_download_pdf(url, dest, client=None):
+        calls["download"] += 1
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(b"%PDF-1.4 FAKEPDF")
+        return dest
+
+    async def fake_extract_text(pdf_path: Path):
+        calls["extract"] += 1
+        return "Extracted text"
+
+    import arxiv_agent.ingest as ingest
+
+    monkeypatch.setattr(ingest, "search_arxiv", fake_search_arxiv)
+    monkeypatch.setattr(ingest, "download_pdf", fake_download_pdf)
+    monkeypatch.setattr(ingest, "extract_text", fake_extract_text)
+
+    db = tmp_path / "ingest.db"
+    first = await ingest.ingest_query("q", max_results=1, output_dir=tmp_path / "a", concurrency=1, db_path=db)
+    # a different output dir has no files, but the DB knows where the text is
+    second = await ingest.ingest_query("q", max_results=1, output_dir=tmp_path / "b", concurrency=1, db_path=db)
+    assert calls == {"download": 1, "extract": 1}
+    assert second[0]["success"] is True
+    assert second[0]["text_path"] == first[0]["text_path"]
+
+    await ingest.ingest_query("q", max_results=1, output_dir=tmp_path / "b", concurrency=1, db_path=db, force=True)
+    assert calls == {"download": 2, "extract": 2}
@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from arxiv_agent import __main__ as cli
+from arxiv_agent.db import get_embeddings_for_paper, init_db, upsert_paper
+from arxiv_agent.models import PaperMetadata
+
+
+def test_cli_embed(tmp_path: Path, monkeypatch, loop):
+    db = tmp_path / "cli.db"
+    loop.run_until_complete(init_db(db))
+    pid = loop.run_until_complete(upsert_paper(db, PaperMetadata(arxiv_id="2101.cli", title="CLI"), text_path=str(tmp_path / "t.txt")))
+    (tmp_path / "t.txt").write_text("Text for the CLI", encoding="utf-8")
+
+    monkeypatch.setattr("arxiv_agent.embeddings.get_embeddings_batch", lambda texts, backend, model=None: [[0.1, 0.2] for _ in texts])
+    monkeypatch.setattr(sys, "argv", ["arxiv-agent", "--embed", "--db", str(db), "--embed-backend", "local", "--embed-model", "m"])
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main()
+    assert exit_info.value.code == 0
+    assert len(loop.run_until_complete(get_embeddings_for_paper(db, pid))) == 1
+
+
+def test_cli_embed_fp16(tmp_path: Path, monkeypatch, loop):
+    from arxiv_agent.db import get_conn
+
+    db = tmp_path / "cli16.db"
+    loop.run_until_complete(init_db(db))
+    pid = loop.run_until_complete(upsert_paper(db, PaperMetadata(arxiv_id="2101.cli16", title="CLI fp16"), text_path=str(tmp_path / "t.txt")))
+    (tmp_path / "t.txt").write_text("Text for the CLI", encoding="utf-8")
+
+    monkeypatch.setattr("arxiv_agent.embeddings.get_embeddings_batch", lambda texts, backend, model=None: [[0.25, 0.5] for _ in texts])
+    monkeypatch.setattr(sys, "argv", ["arxiv-agent", "--embed", "--embed-fp16", "--db", str(db), "--embed-backend", "local", "--embed-model", "m"])
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main()
+    assert exit_info.value.code == 0
+
+    async def stored_dtypes():
+        async with (await get_conn(db)).execute("SELECT dtype, length(vector) FROM embeddings") as cur:
+            return await cur.fetchall()
+
+    assert loop.run_until_complete(stored_dtypes()) == [("float16", 4)]
+    (emb,) = loop.run_until_complete(get_embeddings_for_paper(db, pid))
+    assert emb["vector"].dtype.name == "float16"
+    assert emb["vector"].tolist() == [0.25, 0.5]
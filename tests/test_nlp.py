@@ -1,4 +1,4 @@
-from arxiv_agent.nlp import clean_text, tokenize
+from arxiv_agent.nlp import clean_text, tokenize, tokenize_iter
 
 
 def test_clean_text_basic():
@@ -15,3 +15,104 @@ def test_tokenize():
     assert "Hello" in toks
     assert "world" in toks
     assert "123" in toks
+    assert list(tokenize_iter(s)) == toks
+    assert list(tokenize_iter("")) == []
+
+
+def test_clean_text_control_chars_and_blank_lines():
+    s = "a\x00b\x0c  c\r\r\r\rd"
+    assert clean_text(s) == "ab c\n\nd"
+
+
+def test_clean_text_tabs_and_zero_width():
+    assert clean_text("\ufeffa\t\tb \u200bc\xa0 d") == "a b c d"
+
+
+def test_local_model_loaded_once(monkeypatch):
+    import sys
+    import types
+
+    import numpy as np
+
+    from arxiv_agent import nlp
+
+    loads = []
+
+    class FakeModel:
+        def __init__(self, name):
+            loads.append(name)
+
+        def encode(self, texts, **kwargs):
+            if isinstance(texts, str):
+                return np.ones(3)
+            return np.ones((len(texts), 3))
+
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(SentenceTransformer=FakeModel))
+    nlp._st_model.cache_clear()
+    try:
+        assert nlp.get_embedding_local("a", model_name="fake") == [1.0, 1.0, 1.0]
+        batch = nlp.get_embeddings_local(["a", "b"], model_name="fake")
+        assert batch.shape == (2, 3) and batch.dtype == np.float32
+        assert loads == ["fake"]
+    finally:
+        nlp._st_model.cache_clear()
+
+
+def test_openai_batches_use_one_request_per_chunk(monkeypatch):
+    import sys
+    import types
+
+    from arxiv_agent import nlp
+
+    requests = []
+
+    class FakeEmbeddings:
+        def create(self, input, model):
+            requests.append(len(input))
+            # the API may return items out of order; `index` maps them back
+            data = [types.SimpleNamespace(index=i, embedding=[float(len(t))]) for i, t in enumerate(input)]
+            return types.SimpleNamespace(data=data[::-1])
+
+    class FakeClient:
+        def __init__(self, api_key):
+            self.embeddings = FakeEmbeddings()
+
+    monkeypatch.setitem(sys.modules, "openai", types.SimpleNamespace(OpenAI=FakeClient))
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(nlp, "OPENAI_MAX_INPUTS", 2)
+    nlp._openai_client.cache_clear()
+    try:
+        assert nlp.get_embeddings_openai(["a", "bb", "ccc"]) == [[1.0], [2.0], [3.0]]
+        assert requests == [2, 1]
+        assert nlp.get_embedding_openai("dddd") == [4.0]
+    finally:
+        nlp._openai_client.cache_clear()
+
+
+def test_openai_request_slices_respect_token_limit(monkeypatch):
+    from arxiv_agent import nlp
+
+    monkeypatch.setattr(nlp, "OPENAI_MAX_REQUEST_TOKENS", 10)
+    assert nlp.openai_request_slices([4, 4, 4, 12, 1]) == [slice(0, 2), slice(2, 3), slice(3, 4), slice(4, 5)]
+    assert nlp.openai_request_slices([]) == []
+
+
+def test_truncate_tokens_caps_openai_inputs(monkeypatch):
+    from arxiv_agent import nlp
+
+    class FakeEncoding:
+        # one token per character
+        def encode(self, text, disallowed_special=()):
+            return list(text)
+
+        def decode(self, tokens):
+            return "".join(tokens)
+
+    monkeypatch.setattr(nlp, "_token_encoding", lambda model: FakeEncoding())
+    assert nlp.truncate_tokens("abcdef", 4) == ("abcd", 4)
+    assert nlp.truncate_tokens("ab", 4) == ("ab", 2)
+
+    monkeypatch.setattr(nlp, "_token_encoding", lambda model: None)
+    # same ~4 characters per token as count_tokens
+    text, n = nlp.truncate_tokens("x" * 100, 10)
+    assert len(text) == 40 and n == 10
@@ -0,0 +1,25 @@
+import time
+
+import pytest
+
+from arxiv_agent.ratelimit import RateLimiter
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_waits_for_request_quota():
+    limiter = RateLimiter(rpm=2, window=0.2)
+    start = time.monotonic()
+    await limiter.acquire()
+    await limiter.acquire()
+    assert time.monotonic() - start < 0.1
+    await limiter.acquire()
+    assert time.monotonic() - start >= 0.2
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_waits_for_token_quota():
+    limiter = RateLimiter(tpm=100, window=0.2)
+    start = time.monotonic()
+    await limiter.acquire(80)
+    await limiter.acquire(80)
+    assert time.monotonic() - start >= 0.2